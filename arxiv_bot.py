@@ -1,11 +1,18 @@
 # arxiv_bot.py
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from textwrap import dedent
-from typing import Dict, List
+from functools import partial
+from typing import Dict, List, Optional, Set
 
 import arxiv
 
+import digest_store
+import tracing
+from state_store import HighWaterMarks, SeenIndex
+from utils import arxiv_id_from_url
+
 
 # ----------- arXiv client -----------
 def make_client(page_size: int = 3, delay_seconds: int = 3, num_retries: int = 3) -> arxiv.Client:
@@ -16,14 +23,210 @@ def make_client(page_size: int = 3, delay_seconds: int = 3, num_retries: int = 3
     )
 
 
-def get_papers(client: arxiv.Client, query: str, max_results: int = 100) -> List[arxiv.Result]:
-    search = arxiv.Search(
+_clients: Dict[int, arxiv.Client] = {}
+
+
+def get_client(page_size: int = 3) -> arxiv.Client:
+    """
+    One client per page size for the life of the process: a long-running process (main.py serve)
+    keeps its HTTP session, and the client's delay_seconds spacing holds across polls.
+    """
+    client = _clients.get(page_size)
+    if client is None:
+        client = _clients[page_size] = make_client(page_size=page_size)
+    return client
+
+
+def _search(query: str, max_results: Optional[int]) -> arxiv.Search:
+    return arxiv.Search(
         query=query,
         max_results=max_results,
         sort_by=arxiv.SortCriterion.SubmittedDate,
         sort_order=arxiv.SortOrder.Descending,
     )
-    return list(client.results(search))
+
+
+def get_papers(client: arxiv.Client, query: str, max_results: int = 100) -> List[arxiv.Result]:
+    with tracing.span("arxiv.query", query=query, max_results=max_results) as sp:
+        results = list(client.results(_search(query, max_results)))
+        sp.set(results=len(results))
+    return results
+
+
+# ----------- Incremental search -----------
+# Optional safety cap on new papers per query and run (0 = none: page until the high-water mark).
+# A listing cut by the cap leaves the keyword's mark where it is (the papers past the cap were never seen).
+HWM_MAX_RESULTS = int(os.getenv("ARXIV_HWM_MAX_RESULTS", "0"))
+
+
+def _hit_cap(query: str, truncated: Optional[Set[str]]):
+    print(f"[arxiv] {query!r}: more than {HWM_MAX_RESULTS} new papers since the last run "
+          f"(ARXIV_HWM_MAX_RESULTS); its high-water mark is not moved")
+    if truncated is not None:
+        truncated.add(query)
+
+
+def get_new_papers(
+    client: arxiv.Client, query: str, since: datetime, truncated: Optional[Set[str]] = None
+) -> List[arxiv.Result]:
+    """
+    Newest-first results published after `since` (the query's high-water mark).
+    Pages are fetched lazily, so paging stops as soon as the mark is crossed. If HWM_MAX_RESULTS
+    stops the listing first, `query` is added to `truncated`.
+    """
+    results = []
+    with tracing.span("arxiv.query", query=query, since=since.isoformat()) as sp:
+        for r in client.results(_search(query, HWM_MAX_RESULTS + 1 if HWM_MAX_RESULTS else None)):
+            if r.published <= since:
+                break
+            if HWM_MAX_RESULTS and len(results) >= HWM_MAX_RESULTS:
+                _hit_cap(query, truncated)
+                break
+            results.append(r)
+        sp.set(results=len(results))
+    return results
+
+
+# ----------- Batched search -----------
+BATCH_MAX_KEYWORDS = 8        # keywords OR'ed into one arXiv query
+BATCH_MAX_QUERY_CHARS = 500   # keep search_query well below arXiv's URL limits
+BATCH_OVERFETCH = 3           # fetch N * keywords * this per batch before assigning locally
+
+
+def _keyword_terms(keyword: str) -> List[str]:
+    return re.findall(r"\w+", keyword.lower())
+
+
+def _keyword_clause(keyword: str) -> str:
+    """'video understanding' -> 'all:video AND all:understanding' (same terms get_papers would send)."""
+    return " AND ".join(f"all:{t}" for t in _keyword_terms(keyword))
+
+
+def matches_keyword(text: str, keyword: str) -> bool:
+    """Every term of the keyword starts a word in text (so 'avatar' also matches 'avatars')."""
+    text = text.lower()
+    return all(re.search(rf"\b{re.escape(t)}", text) for t in _keyword_terms(keyword))
+
+
+def _batch_keywords(keywords: List[str]) -> List[List[str]]:
+    batches: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for kw in keywords:
+        clause_len = len(_keyword_clause(kw)) + len(" OR ()")
+        if current and (len(current) >= BATCH_MAX_KEYWORDS or size + clause_len > BATCH_MAX_QUERY_CHARS):
+            batches.append(current)
+            current, size = [], 0
+        current.append(kw)
+        size += clause_len
+    if current:
+        batches.append(current)
+    return batches
+
+
+def get_papers_batched(
+    client: arxiv.Client,
+    keywords: List[str],
+    max_results_per_query: int,
+    since: Optional[Dict[str, Optional[datetime]]] = None,
+    truncated: Optional[Set[str]] = None,
+) -> Dict[str, List[arxiv.Result]]:
+    """
+    Fetch listings for many keywords with as few arXiv requests as possible.
+    Keywords are OR'ed into batch queries; each result is assigned back to every keyword whose terms
+    appear in its title/abstract, newest first. A keyword gets at most max_results_per_query papers,
+    or, if it has a high-water mark in `since`, every paper newer than the mark (a batch with marks
+    pages until all of them are crossed; see HWM_MAX_RESULTS and `truncated` in get_new_papers).
+    A keyword that the merged listing crowded out falls back to its own query.
+    """
+    since = since or {}
+    listings: Dict[str, List[arxiv.Result]] = {kw: [] for kw in keywords}
+
+    for batch in _batch_keywords(keywords):
+        query = " OR ".join(f"({_keyword_clause(kw)})" for kw in batch)
+        marked = [kw for kw in batch if since.get(kw)]
+        # keywords without a mark share an overfetch budget; marked ones page until their mark
+        limit = sum(max_results_per_query * BATCH_OVERFETCH for kw in batch if kw not in marked)
+        crossed = set()  # keywords whose high-water mark the (newest-first) listing has passed
+        capped = set()  # marked keywords stopped by HWM_MAX_RESULTS
+
+        def _done(kw: str) -> bool:
+            if kw in marked:
+                return kw in crossed or kw in capped
+            return len(listings[kw]) >= max_results_per_query or fetched >= limit
+
+        fetched = 0
+        with tracing.span("arxiv.query", query=query, max_results=None if marked else limit,
+                          keywords=len(batch)) as sp:
+            for r in client.results(_search(query, None if marked else limit)):
+                fetched += 1
+                text = f"{r.title}\n{r.summary}"
+                for kw in batch:
+                    mark = since.get(kw)
+                    if mark is not None and r.published <= mark:
+                        crossed.add(kw)
+                    elif kw in crossed or kw in capped or not matches_keyword(text, kw):
+                        continue
+                    elif mark is None:
+                        if len(listings[kw]) < max_results_per_query:
+                            listings[kw].append(r)
+                    elif HWM_MAX_RESULTS and len(listings[kw]) >= HWM_MAX_RESULTS:
+                        capped.add(kw)
+                        _hit_cap(kw, truncated)
+                    else:
+                        listings[kw].append(r)
+                if all(_done(kw) for kw in batch):
+                    break
+            sp.set(results=fetched)
+        if fetched >= limit:
+            # Listing was truncated: a short keyword list may be missing older matches.
+            for kw in batch:
+                if kw not in marked and len(listings[kw]) < max_results_per_query:
+                    listings[kw] = get_papers(client, query=kw, max_results=max_results_per_query)
+    return listings
+
+
+def get_papers_mirrored(
+    keywords: List[str],
+    max_results_per_query: int,
+    since: Optional[Dict[str, Optional[datetime]]] = None,
+    truncated: Optional[Set[str]] = None,
+) -> Dict[str, List[arxiv.Result]]:
+    """Listings from the local metadata mirror (see arxiv_mirror), harvested up to date first."""
+    import arxiv_mirror  # imports this module
+    arxiv_mirror.harvest()
+    return arxiv_mirror.get_papers_mirrored(keywords, max_results_per_query, since, truncated)
+
+
+def list_new_papers(
+    keywords: List[str],
+    max_results_per_query: int,
+    batch_queries: bool = False,
+    incremental: bool = False,
+    source: str = "api",
+) -> Dict[str, List[arxiv.Result]]:
+    """
+    The listings run_daily_digest would work on (same queries, same high-water marks), without
+    summarizing anything or moving the marks.
+    """
+    since = {}
+    if incremental:
+        marks = HighWaterMarks()
+        try:
+            since = {kw: marks.get(kw) for kw in keywords}
+        finally:
+            marks.close()
+    if source == "mirror":
+        return get_papers_mirrored(keywords, max_results_per_query, since)
+    if batch_queries:
+        page_size = min(100, max_results_per_query * BATCH_MAX_KEYWORDS * BATCH_OVERFETCH)
+        return get_papers_batched(get_client(page_size=page_size), keywords, max_results_per_query, since)
+    client = get_client(page_size=max(max_results_per_query, 20) if incremental else max_results_per_query)
+    return {
+        kw: get_new_papers(client, query=kw, since=since[kw]) if since.get(kw)
+        else get_papers(client, query=kw, max_results=max_results_per_query)
+        for kw in keywords
+    }
 
 
 # ----------- File I/O utils -----------
@@ -49,11 +252,41 @@ def append_text(path: str, content: str):
 
 
 # ----------- Digest runner -----------
+def _summarize_paper(r: arxiv.Result, summarize_pdf_fn, summary_to_markdown_fn) -> digest_store.Record:
+    """
+    Summarize one paper into a "paper" store record (without its keyword).
+    Failures are recorded in "error" and rendered as a "(summary failed: ...)" block.
+    """
+    entry_id = getattr(r, "entry_id", None) or ""
+    pdf_url = getattr(r, "pdf_url", None) or entry_id
+    title = r.title.replace("\n", " ").strip()
+    record = {
+        "type": "paper",
+        "entry_id": entry_id,
+        "pdf_url": pdf_url,
+        "title": title,
+        "published": r.published.isoformat() if r.published else None,
+        "summary": None,
+        "error": None,
+    }
+    try:
+        summary = summarize_pdf_fn(pdf_url)
+        summary_to_markdown_fn(summary)  # a summary that can't be rendered counts as failed
+        record["summary"] = summary
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
 def run_daily_digest(
     keywords_by_topic: Dict[str, List[str]],
     max_results_per_query: int,
     summarize_pdf_fn,
     summary_to_markdown_fn,
+    max_workers: int = 1,
+    batch_queries: bool = False,
+    incremental: bool = False,
+    source: str = "api",
 ) -> str:
     """
     执行一次“每日摘要”生成。
@@ -61,6 +294,13 @@ def run_daily_digest(
     - max_results_per_query: 每个关键词最多取多少篇
     - summarize_pdf_fn: 函数(pdf_url) -> 结构化摘要dict
     - summary_to_markdown_fn: 函数(summary_dict) -> markdown字符串
+    - max_workers: 并发处理论文的线程数（<=1 时逐篇顺序处理）
+    - batch_queries: 合并关键词为少量 OR 查询，再在本地按标题/摘要分配给各关键词
+    - incremental: 记录每个关键词已处理的最新发布时间，下次只拉取更新的论文
+    - source: "api" 使用 arXiv 搜索 API；"mirror" 使用本地元数据镜像（arxiv_mirror），一次匹配全部关键词
+
+    结构化结果追加到 YYYY/MM/DD.jsonl（digest_store），Markdown 由其渲染；
+    没有 .jsonl 的旧日期文件仍按原方式直接追加 Markdown。
 
     返回值：生成/更新的 Markdown 文件路径（YYYY/MM/DD.md）
     """
@@ -77,50 +317,175 @@ def run_daily_digest(
     ensure_dir(out_dir)
     out_md = os.path.join(out_dir, f"{day}.md")
 
+    # Structured store next to the markdown; a day that predates the store keeps appending markdown only
+    out_store = digest_store.store_path(out_md)
+    use_store = os.path.exists(out_store) or not os.path.exists(out_md)
+
+    def _emit(records: List[digest_store.Record]):
+        if use_store:
+            digest_store.append(out_store, records)
+        append_text(out_md, digest_store.render_markdown(records, summary_to_markdown_fn))
+
     # Header (create if missing)
     if not os.path.exists(out_md):
-        today_full = now.strftime("%Y-%m-%d")
-        header = dedent(f"""\
-        # Daily Paper Digest · {today_full}
-        > Auto-generated: Recent submissions from arXiv are fetched by topic and keyword (up to {max_results_per_query} papers per query).
-        """)
-        write_text(out_md, header)
-
-    # Dedup guard: skip if arXiv entry_id already present in the file
+        write_text(out_md, "")
+        _emit([{"type": "header", "day": now.strftime("%Y-%m-%d"), "max_results": max_results_per_query}])
+
+    # Dedup guard: skip papers already summarized on any day of the archive (global index),
+    # falling back to a substring check of today's file for non-arXiv ids
     existing = read_text(out_md)
+    seen = SeenIndex()
+    scanned, added = seen.sync_archive(".")
+    if scanned:
+        print(f"[seen] indexed {scanned} digest files (+{added} papers, {len(seen)} total)")
 
-    client = make_client(page_size=max_results_per_query)
+    # Papers written to today's store, so a keyword listing one of them again gets a paper_ref
+    # (a subscriber following only that keyword still sees the paper) instead of a second summary
+    written_today = set()
+    # Keywords with a section in today's file: a later run (e.g. a serve poll) only repeats the heading
+    # when it writes a paper or paper_ref under it, and never repeats "no results"
+    sectioned = set()
+    if use_store and os.path.exists(out_store):
+        today = digest_store.load(out_store)
+        written_today = {r["entry_id"] for r in today if r["type"] == "paper" and r.get("error") is None}
+        sectioned = {r["keyword"] for r in today if r["type"] == "section"}
 
-    for topic, keywords in keywords_by_topic.items():
-        # 你可以将 topic 也写入分组（如果想显示 topic 标题，把下面一行取消注释）
-        # append_text(out_md, f"\n## {topic}\n")
-        for kw in keywords:
-            append_text(out_md, f"\n## {kw}\n")
-            results = get_papers(client, query=kw, max_results=max_results_per_query)
-            if not results:
-                append_text(out_md, "- (No results)\n")
+    def _ref(keyword: str, entry_id: str) -> Optional[digest_store.Record]:
+        if entry_id in written_today:
+            return {"type": "paper_ref", "keyword": keyword, "entry_id": entry_id}
+        return None
+
+    def _already_done(entry_id: str) -> bool:
+        arxiv_id = arxiv_id_from_url(entry_id)
+        if arxiv_id:
+            return arxiv_id in seen
+        return bool(entry_id) and entry_id in existing
+
+    all_keywords = list(dict.fromkeys(kw for kws in keywords_by_topic.values() for kw in kws))
+
+    # High-water marks: with a mark, a keyword only gets papers published after it
+    marks = HighWaterMarks() if incremental else None
+    since = {kw: marks.get(kw) for kw in all_keywords} if marks else {}
+    kw_results: Dict[str, List[arxiv.Result]] = {}
+    truncated: Set[str] = set()  # keywords whose new-paper listing HWM_MAX_RESULTS cut short
+
+    client = get_client(page_size=max(max_results_per_query, 20) if incremental else max_results_per_query)
+
+    listings = None
+    if source == "mirror":
+        listings = get_papers_mirrored(all_keywords, max_results_per_query, since, truncated)
+    elif batch_queries:
+        page_size = min(100, max_results_per_query * BATCH_MAX_KEYWORDS * BATCH_OVERFETCH)
+        listings = get_papers_batched(get_client(page_size=page_size), all_keywords, max_results_per_query,
+                                      since, truncated)
+
+    # Papers are summarized in a bounded thread pool (or lazily, one by one, when
+    # max_workers <= 1), but the markdown is always written in keyword/paper order.
+    pool = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    jobs = {}  # entry_id -> Future / partial, so a paper listed under two keywords is summarized once
+    pending = []  # (kind, entry_id, payload) in output order
+    failed = set()  # entry_ids whose summary failed: the marks must not move past them
+
+    held = []  # section heading of a keyword already in today's file, until something is written under it
+
+    def _emit_under_section(records: List[digest_store.Record]):
+        _emit(held + records)
+        held.clear()
+
+    def _write_in_order(plan):
+        nonlocal existing
+        for kind, entry_id, payload in plan:
+            if kind == "section":
+                keyword, empty = payload
+                held.clear()
+                section = [{"type": "section", "keyword": keyword}]
+                if keyword not in sectioned:
+                    sectioned.add(keyword)
+                    _emit(section + ([{"type": "no_results", "keyword": keyword}] if empty else []))
+                elif not empty:
+                    held.extend(section)
                 continue
+            if kind == "record":
+                _emit_under_section([payload])
+                continue
+            keyword, job = payload
+            # Dedup is re-checked at write time: the first successful occurrence wins,
+            # however the underlying jobs finished.
+            if _already_done(entry_id):
+                ref = _ref(keyword, entry_id)
+                if ref:
+                    _emit_under_section([ref])
+                continue
+            record = dict(job.result() if pool else job(), keyword=keyword)
+            _emit_under_section([record])
+            if record["error"] is None:
+                # Update the index to avoid duplicates in the same run (and in later runs)
+                existing += entry_id
+                written_today.add(entry_id)
+                if arxiv_id_from_url(entry_id):
+                    seen.add(arxiv_id_from_url(entry_id), f"{year}-{month}-{day}")
+            else:
+                failed.add(entry_id)
 
-            for r in results:
-                entry_id = getattr(r, "entry_id", None) or ""
-                pdf_url = getattr(r, "pdf_url", None) or entry_id
-                title = r.title.replace("\n", " ").strip()
-                # published = r.published.strftime("%Y-%m-%d") if r.published else "N/A"  # 如需显示日期可启用
+    try:
+        for topic, keywords in keywords_by_topic.items():
+            # 你可以将 topic 也写入分组（如果想显示 topic 标题，把下面一行取消注释）
+            # append_text(out_md, f"\n## {topic}\n")
+            for kw in keywords:
+                if listings is not None:
+                    results = listings[kw]
+                elif since.get(kw):
+                    results = get_new_papers(client, query=kw, since=since[kw], truncated=truncated)
+                else:
+                    results = get_papers(client, query=kw, max_results=max_results_per_query)
+                kw_results[kw] = results
+                plan = [("section", "", (kw, not results))]
 
-                # Skip if already in digest (simple ID check)
-                if entry_id and entry_id in existing:
-                    continue
+                for r in results:
+                    entry_id = getattr(r, "entry_id", None) or ""
+
+                    # Skip if already in the archive
+                    if _already_done(entry_id):
+                        ref = _ref(kw, entry_id)
+                        if ref:
+                            plan.append(("record", "", ref))
+                        continue
 
-                # Summarize PDF
-                try:
-                    summary = summarize_pdf_fn(pdf_url)
-                    summary_md = summary_to_markdown_fn(summary)
-                    paper_head = f"\n### [{title}]({pdf_url})\n\n"
-                    append_text(out_md, paper_head + summary_md)
-                    # Update existing cache to avoid duplicates in the same run
-                    existing += entry_id
-                except Exception as e:
-                    append_text(out_md, f"\n### [{title}]({pdf_url})\n  (summary failed: {e})\n\n")
+                    job = jobs.get(entry_id) if entry_id else None
+                    if job is None:
+                        if pool:
+                            job = pool.submit(_summarize_paper, r, summarize_pdf_fn, summary_to_markdown_fn)
+                        else:
+                            job = partial(_summarize_paper, r, summarize_pdf_fn, summary_to_markdown_fn)
+                        if entry_id:
+                            jobs[entry_id] = job
+                    plan.append(("paper", entry_id, (kw, job)))
+
+                if pool:
+                    # Keep fetching listings while the pool works; write once everything is queued.
+                    pending.extend(plan)
+                else:
+                    _write_in_order(plan)
+
+        _write_in_order(pending)
+
+        # Move the marks forward over what has been written (or was already in the archive), but stay
+        # below a keyword's oldest failed paper so the next run lists and retries it (and leave a mark
+        # alone when the listing was cut by HWM_MAX_RESULTS: older new papers were never fetched)
+        if marks:
+            for kw, results in kw_results.items():
+                if kw in truncated:
+                    continue
+                retry = [r.published for r in results if (getattr(r, "entry_id", None) or "") in failed]
+                done = [r.published for r in results if not retry or r.published < min(retry)]
+                if done:
+                    marks.advance(kw, max(done))
+    finally:
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+        seen.close()
+        if marks:
+            marks.close()
 
     # Optional: update README with a link to today's digest
     readme_path = "README.md"
@@ -0,0 +1,341 @@
+# arxiv_mirror.py
+"""
+Local mirror of recent arXiv listing metadata, matched against every keyword in one pass.
+
+Harvester: arXiv's OAI-PMH interface (ListRecords, metadataPrefix=arXivRaw) for the sets in
+ARXIV_MIRROR_SETS, incrementally by datestamp (each harvest restarts at the day of the previous
+one; rows are upserted). One row per paper in <cache>/arxiv_mirror.sqlite: id, latest version,
+title, abstract, categories and the date of its first version. Papers first submitted more than
+ARXIV_MIRROR_DAYS ago are dropped.
+
+Recorded feeds: with ARXIV_MIRROR_RECORD_DIR set, every harvested XML page is also saved there;
+harvest_files() loads such pages (or any saved ListRecords response) without network, so the
+mirror and the matcher can be checked against a fixed feed.
+
+Matcher: KeywordMatcher builds one Aho-Corasick automaton over the terms of all keywords and
+scans each title + abstract once. A keyword matches when every one of its terms starts a word,
+the rule of arxiv_bot.matches_keyword, so the result is the same as testing the keywords one by
+one, but adding keywords costs next to nothing per paper.
+
+Environment variables:
+   - ARXIV_OAI_URL: OAI-PMH endpoint (default http://export.arxiv.org/oai2)
+   - ARXIV_MIRROR_SETS: comma-separated OAI sets to harvest (default "cs")
+   - ARXIV_MIRROR_DAYS: days of submissions kept, and harvested by the first run (default 7)
+   - ARXIV_MIRROR_MIN_INTERVAL_MINUTES: a set harvested less than this long ago is not harvested again
+     (default 180; arXiv updates the feed once a day, and every harvest re-reads the whole day)
+   - ARXIV_MIRROR_URL: prefix of the abs/pdf links of mirrored papers (default http://arxiv.org)
+   - ARXIV_MIRROR_RECORD_DIR: also save every harvested XML page in this directory
+"""
+
+import os
+import re
+import sqlite3
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import arxiv
+
+import tracing
+from arxiv_bot import HWM_MAX_RESULTS, _hit_cap, _keyword_terms
+from utils import cache_path
+
+DB_NAME = "arxiv_mirror.sqlite"
+OAI_URL = os.getenv("ARXIV_OAI_URL", "http://export.arxiv.org/oai2")
+SETS = [s.strip() for s in os.getenv("ARXIV_MIRROR_SETS", "cs").split(",") if s.strip()]
+MIRROR_DAYS = float(os.getenv("ARXIV_MIRROR_DAYS", "7"))
+MIRROR_URL = os.getenv("ARXIV_MIRROR_URL", "http://arxiv.org").rstrip("/")
+RECORD_DIR = os.getenv("ARXIV_MIRROR_RECORD_DIR", "")
+MIN_INTERVAL_MINUTES = float(os.getenv("ARXIV_MIRROR_MIN_INTERVAL_MINUTES", "180"))
+TIMEOUT = 60
+MAX_RETRIES = 5  # 503 + Retry-After is OAI-PMH flow control, not an error
+
+_NS = {"oai": "http://www.openarchives.org/OAI/2.0/", "raw": "http://arxiv.org/OAI/arXivRaw/"}
+_WORD_CHAR = re.compile(r"\w").match
+
+
+# ------------ Multi-keyword matcher ------------
+class KeywordMatcher:
+    """Aho-Corasick over the lowercased terms of many keywords; match(text) == [kw for kw if matches_keyword(text, kw)]."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = list(dict.fromkeys(keywords))
+        self._terms = {kw: set(_keyword_terms(kw)) for kw in self.keywords}
+        self._by_term: Dict[str, List[str]] = defaultdict(list)
+        for kw, terms in self._terms.items():
+            for t in terms:
+                self._by_term[t].append(kw)
+        self._always = [kw for kw, terms in self._terms.items() if not terms]  # no terms: matches anything
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[List[str]] = [[]]  # terms ending at each node, fail chain included
+        for term in self._by_term:
+            node = 0
+            for ch in term:
+                if ch not in self._goto[node]:
+                    self._goto.append({})
+                    self._out.append([])
+                    self._goto[node][ch] = len(self._goto) - 1
+                node = self._goto[node][ch]
+            self._out[node].append(term)
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def terms_in(self, text: str) -> Set[str]:
+        """Terms that start a word somewhere in text (lowercased first, as matches_keyword does)."""
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[str] = set()
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for term in out[node]:
+                start = i - len(term) + 1
+                if start == 0 or not _WORD_CHAR(text[start - 1]):
+                    found.add(term)
+        return found
+
+    def match(self, text: str) -> List[str]:
+        found = self.terms_in(text)
+        candidates = {kw for t in found for kw in self._by_term[t]}
+        return [kw for kw in self.keywords
+                if kw in self._always or (kw in candidates and self._terms[kw] <= found)]
+
+
+# ------------ Store ------------
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(cache_path(DB_NAME), timeout=30)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS papers (
+            id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            abstract TEXT NOT NULL,
+            categories TEXT NOT NULL,
+            published REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS papers_published ON papers (published);
+        CREATE TABLE IF NOT EXISTS harvests (
+            set_spec TEXT PRIMARY KEY,
+            day TEXT NOT NULL,
+            harvested REAL NOT NULL DEFAULT 0  -- unix time the last harvest of the set finished
+        );
+        """
+    )
+    if "harvested" not in {row[1] for row in conn.execute("PRAGMA table_info(harvests)")}:
+        conn.execute("ALTER TABLE harvests ADD COLUMN harvested REAL NOT NULL DEFAULT 0")
+    return conn
+
+
+def _text(elem: Optional[ET.Element]) -> str:
+    return " ".join((elem.text or "").split()) if elem is not None else ""
+
+
+def parse_records(xml: bytes) -> Tuple[List[Tuple], Optional[str]]:
+    """Rows (id, version, title, abstract, categories, published, updated) of one ListRecords page, and its resumptionToken."""
+    root = ET.fromstring(xml)
+    error = root.find("oai:error", _NS)
+    if error is not None:
+        if error.get("code") == "noRecordsMatch":
+            return [], None
+        raise RuntimeError(f"OAI-PMH error {error.get('code')}: {error.text}")
+    rows = []
+    for record in root.iterfind("oai:ListRecords/oai:record", _NS):
+        raw = record.find("oai:metadata/raw:arXivRaw", _NS)
+        if raw is None:  # deleted record
+            continue
+        dates = [parsedate_to_datetime(_text(v.find("raw:date", _NS))) for v in raw.iterfind("raw:version", _NS)]
+        if not dates:
+            continue
+        rows.append((
+            _text(raw.find("raw:id", _NS)),
+            len(dates),
+            _text(raw.find("raw:title", _NS)),
+            _text(raw.find("raw:abstract", _NS)),
+            _text(raw.find("raw:categories", _NS)),
+            dates[0].timestamp(),
+            dates[-1].timestamp(),
+        ))
+    token = root.find("oai:ListRecords/oai:resumptionToken", _NS)
+    return rows, (token.text.strip() if token is not None and token.text and token.text.strip() else None)
+
+
+def _store(conn: sqlite3.Connection, rows: List[Tuple]) -> int:
+    cutoff = time.time() - MIRROR_DAYS * 86400
+    rows = [r for r in rows if r[5] >= cutoff]  # new versions of old papers are not new submissions
+    conn.executemany(
+        """
+        INSERT INTO papers (id, version, title, abstract, categories, published, updated)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET version = excluded.version, title = excluded.title,
+            abstract = excluded.abstract, categories = excluded.categories, updated = excluded.updated
+        """,
+        rows,
+    )
+    return len(rows)
+
+
+def _fetch(url: str) -> bytes:
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(url, timeout=TIMEOUT) as resp:
+                return resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code != 503 or attempt == MAX_RETRIES:
+                raise
+            wait = float(e.headers.get("Retry-After") or 10)
+            print(f"[mirror] OAI-PMH busy, retrying in {wait:g}s")
+            time.sleep(min(wait, 120))
+    raise RuntimeError("unreachable")
+
+
+def _record(set_spec: str, page: int, xml: bytes):
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{set_spec.replace(':', '_')}-{page:04d}.xml"
+    with open(os.path.join(RECORD_DIR, name), "wb") as f:
+        f.write(xml)
+
+
+def harvest(sets: Optional[List[str]] = None, force: bool = False) -> int:
+    """
+    Bring the mirror up to date from OAI-PMH. Returns the number of records stored.
+    Sets harvested less than MIN_INTERVAL_MINUTES ago are skipped unless force=True.
+    """
+    conn = _connect()
+    stored = 0
+    harvested = 0
+    try:
+        for set_spec in sets or SETS:
+            row = conn.execute("SELECT day, harvested FROM harvests WHERE set_spec = ?", (set_spec,)).fetchone()
+            if row and not force and time.time() - row[1] < MIN_INTERVAL_MINUTES * 60:
+                continue
+            harvested += 1
+            since = row[0] if row else (datetime.now(timezone.utc) - timedelta(days=MIRROR_DAYS)).strftime("%Y-%m-%d")
+            started = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            params = {"verb": "ListRecords", "metadataPrefix": "arXivRaw", "set": set_spec, "from": since}
+            page = 0
+            with tracing.span("arxiv.harvest", set=set_spec, since=since) as sp:
+                while params:
+                    xml = _fetch(OAI_URL + "?" + urllib.parse.urlencode(params))
+                    sp.add("bytes", len(xml))
+                    if RECORD_DIR:
+                        _record(set_spec, page, xml)
+                    rows, token = parse_records(xml)
+                    stored += _store(conn, rows)
+                    conn.commit()
+                    page += 1
+                    params = {"verb": "ListRecords", "resumptionToken": token} if token else None
+                sp.set(pages=page)
+            # the next harvest restarts at this day: OAI-PMH `from` has day granularity
+            conn.execute("INSERT OR REPLACE INTO harvests (set_spec, day, harvested) VALUES (?, ?, ?)",
+                         (set_spec, started, time.time()))
+            conn.commit()
+        conn.execute("DELETE FROM papers WHERE published < ?", (time.time() - MIRROR_DAYS * 86400,))
+        conn.commit()
+    finally:
+        conn.close()
+    if harvested:
+        print(f"[mirror] harvested {stored} records")
+    else:
+        print(f"[mirror] up to date (harvested less than {MIN_INTERVAL_MINUTES:g} min ago)")
+    return stored
+
+
+def harvest_files(paths: Iterable[str]) -> int:
+    """Load recorded ListRecords pages (e.g. from ARXIV_MIRROR_RECORD_DIR) into the mirror, no network."""
+    conn = _connect()
+    stored = 0
+    try:
+        for path in sorted(paths):
+            with open(path, "rb") as f:
+                stored += _store(conn, parse_records(f.read())[0])
+        conn.commit()
+    finally:
+        conn.close()
+    return stored
+
+
+# ------------ Listings ------------
+def _result(row: Tuple) -> arxiv.Result:
+    arxiv_id, version, title, abstract, categories, published, updated = row
+    versioned = f"{arxiv_id}v{version}"
+    cats = categories.split()
+    return arxiv.Result(
+        entry_id=f"{MIRROR_URL}/abs/{versioned}",
+        updated=datetime.fromtimestamp(updated, timezone.utc),
+        published=datetime.fromtimestamp(published, timezone.utc),
+        title=title,
+        summary=abstract,
+        primary_category=cats[0] if cats else "",
+        categories=cats,
+        links=[
+            arxiv.Result.Link(f"{MIRROR_URL}/abs/{versioned}", rel="alternate", content_type="text/html"),
+            arxiv.Result.Link(f"{MIRROR_URL}/pdf/{versioned}", title="pdf", rel="related",
+                              content_type="application/pdf"),
+        ],
+    )
+
+
+def get_papers_mirrored(
+    keywords: List[str],
+    max_results_per_query: int,
+    since: Optional[Dict[str, Optional[datetime]]] = None,
+    truncated: Optional[Set[str]] = None,
+) -> Dict[str, List[arxiv.Result]]:
+    """
+    Same contract as arxiv_bot.get_papers_batched, answered from the mirror: newest first, at most
+    max_results_per_query per keyword, or every paper newer than the keyword's high-water mark
+    (keywords cut by HWM_MAX_RESULTS are added to `truncated`). One pass over the mirrored papers, whatever the number of keywords.
+    """
+    since = since or {}
+    listings: Dict[str, List[arxiv.Result]] = {kw: [] for kw in keywords}
+    marks = {kw: since[kw].timestamp() for kw in keywords if since.get(kw)}
+    caps = {kw: (HWM_MAX_RESULTS or None) if kw in marks else max_results_per_query for kw in keywords}
+    matcher = KeywordMatcher(keywords)
+    open_kws = set(keywords)  # keywords that can still take papers
+    scanned = 0
+    conn = _connect()
+    try:
+        with tracing.span("arxiv.mirror_match", keywords=len(keywords)) as sp:
+            for row in conn.execute("SELECT * FROM papers ORDER BY published DESC, id DESC"):
+                scanned += 1
+                published = row[5]
+                for kw in [kw for kw in open_kws if kw in marks and published <= marks[kw]]:
+                    open_kws.discard(kw)  # newest first: the mark is crossed for good
+                if not open_kws:
+                    break
+                hits = [kw for kw in matcher.match(f"{row[2]}\n{row[3]}") if kw in open_kws]
+                if hits:
+                    result = _result(row)
+                    for kw in hits:
+                        if kw in marks and caps[kw] and len(listings[kw]) >= caps[kw]:
+                            open_kws.discard(kw)  # a new paper past the cap
+                            _hit_cap(kw, truncated)
+                            continue
+                        listings[kw].append(result)
+                        if kw not in marks and len(listings[kw]) >= caps[kw]:
+                            open_kws.discard(kw)
+            sp.set(scanned=scanned, results=sum(len(v) for v in listings.values()))
+    finally:
+        conn.close()
+    return listings
\ No newline at end of file
@@ -0,0 +1,107 @@
+# bench/corpus.py
+"""
+Deterministic sample corpus for the offline benchmark: paper metadata plus generated PDFs.
+
+The PDFs are written by a tiny PDF emitter (Helvetica text, one content stream per page), so the
+benchmark needs no binary fixtures and pypdf extracts real text with section headings.
+"""
+
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+_WORDS = (
+    "model data training loss network results dataset baseline accuracy attention layer method "
+    "experiments representation encoder decoder benchmark evaluation ablation performance robust "
+    "efficient scalable framework objective optimization gradient inference latency memory"
+).split()
+_SECTIONS = ["Introduction", "Related Work", "Method", "Experiments", "Conclusion"]
+
+
+@dataclass
+class Paper:
+    arxiv_id: str          # versioned, e.g. 2601.00042v1
+    title: str
+    abstract: str
+    published: datetime
+    pages: List[str]
+
+    def pdf(self) -> bytes:
+        return make_pdf(self.pages)
+
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Minimal valid PDF with one text page per item of `pages` (lines separated by \\n)."""
+    n = len(pages)
+    font_obj = 3 + 2 * n
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>".encode(),
+    ]
+    for i, text in enumerate(pages):
+        ops = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({_escape(l)}) Tj T*" for l in text.split("\n")) + " ET"
+        data = ops.encode("latin-1", "replace")
+        objs.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 {font_obj} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode()
+        )
+        objs.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def _sentence(rng: random.Random, n: int = 14) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _lines(rng: random.Random, count: int) -> List[str]:
+    return [_sentence(rng) for _ in range(count)]
+
+
+def _paper_pages(rng: random.Random, title: str, abstract: str, n_pages: int) -> List[str]:
+    lines = [title, "Anonymous Authors", "Abstract", abstract]
+    body_pages = max(1, n_pages - 1)
+    per_section = max(1, body_pages * 60 // len(_SECTIONS))
+    for i, name in enumerate(_SECTIONS, 1):
+        lines.append(f"{i} {name}")
+        lines += _lines(rng, per_section)
+    lines.append("References")
+    lines += [f"[{k}] A. Author et al. A paper title. In CVPR, 20{k % 25:02d}." for k in range(1, 40)]
+    return ["\n".join(lines[i:i + 60]) for i in range(0, len(lines), 60)][:n_pages + 1]
+
+
+def build_corpus(keywords: List[str], per_keyword: int, pages: int, seed: int = 0) -> Dict[str, Paper]:
+    """`per_keyword` papers whose abstracts mention each keyword, newest first, keyed by arXiv id."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    corpus: Dict[str, Paper] = {}
+    k = 0
+    for kw in keywords:
+        for _ in range(per_keyword):
+            k += 1
+            arxiv_id = f"2601.{k:05d}v1"
+            title = f"{kw.title()} {rng.choice(_WORDS).title()} {rng.choice(_WORDS).title()} {k}"
+            abstract = f"We study {kw}. " + " ".join(_lines(rng, 5))
+            corpus[arxiv_id] = Paper(
+                arxiv_id=arxiv_id,
+                title=title,
+                abstract=abstract,
+                published=now - timedelta(minutes=7 * k),
+                pages=_paper_pages(rng, title, abstract, pages),
+            )
+    return corpus
@@ -0,0 +1,487 @@
+# bench/fakes.py
+"""
+Local stand-ins for the external services the digest talks to.
+
+- FakeArxiv: arXiv Atom API (/api/query), OAI-PMH ListRecords in arXivRaw format (/oai2) and PDF
+  downloads (/pdf/<id>) over HTTP, with latency.
+- FakeOpenAI: OpenAI chat-completions endpoint (/v1/chat/completions) with latency, 429 injection,
+  an in-flight cap and usage (incl. cached prompt tokens) in every response.
+- FakeCalendarAPI: Calendar API events endpoint over HTTP (paging, syncToken, 410 on expired tokens).
+- FakeGmailService: in-process replacement for the googleapiclient Gmail service.
+
+Servers bind to 127.0.0.1 on a free port; use as context managers or call start()/stop().
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+from corpus import Paper
+
+
+class _Server:
+    """ThreadingHTTPServer on a background thread; subclasses implement handle(handler)."""
+
+    def __init__(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+
+            def do_GET(self):
+                server.handle(self)
+
+            def do_POST(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    @staticmethod
+    def send(handler: BaseHTTPRequestHandler, status: int, body: bytes, content_type: str,
+             headers: Optional[Dict[str, str]] = None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        raise NotImplementedError
+
+
+# ------------ arXiv ------------
+_CLAUSE_TERM_RE = re.compile(r"\b(?:all|ti|abs):")
+
+
+def _query_clauses(search_query: str) -> List[List[str]]:
+    """'(all:a AND all:b) OR (all:c)' -> [["a", "b"], ["c"]]; a bare 'video understanding' ANDs its words."""
+    clauses = []
+    for part in re.split(r"\s+OR\s+", search_query):
+        part = _CLAUSE_TERM_RE.sub("", part.strip().strip("()"))
+        terms = [t.strip('"').lower() for t in re.split(r"\s+AND\s+|\s+", part) if t.strip('"')]
+        if terms:
+            clauses.append(terms)
+    return clauses
+
+
+class FakeArxiv(_Server):
+    """
+    Serves `corpus` newest first. Entry and PDF URLs keep the arxiv.org/abs|pdf/<id> shape
+    (prefixed by this server's address), so arXiv id parsing and the PDF cache behave as in production.
+    """
+
+    def __init__(self, corpus: Dict[str, Paper], latency: float = 0.3, pdf_latency: float = 0.1):
+        super().__init__()
+        self.corpus = sorted(corpus.values(), key=lambda p: p.published, reverse=True)
+        self.by_id = {p.arxiv_id: p for p in self.corpus}
+        self.latency = latency
+        self.pdf_latency = pdf_latency
+        self.queries = 0
+        self.oai_requests = 0
+        self.oai_page_size = 100
+        self.pdf_downloads = 0
+        self._pdfs: Dict[str, bytes] = {}
+
+    @property
+    def query_url_format(self) -> str:
+        return self.url + "/api/query?{}"
+
+    def _pdf(self, arxiv_id: str) -> bytes:
+        with self._lock:
+            if arxiv_id not in self._pdfs:
+                self._pdfs[arxiv_id] = self.by_id[arxiv_id].pdf()
+            return self._pdfs[arxiv_id]
+
+    def handle(self, handler):
+        self.count()
+        parsed = urlparse(handler.path)
+        if parsed.path == "/api/query":
+            time.sleep(self.latency)
+            with self._lock:
+                self.queries += 1
+            self.send(handler, 200, self._feed(parse_qs(parsed.query)), "application/atom+xml")
+            return
+        if parsed.path == "/oai2":
+            time.sleep(self.latency)
+            with self._lock:
+                self.oai_requests += 1
+            self.send(handler, 200, self._list_records(parse_qs(parsed.query)), "text/xml")
+            return
+        m = re.match(r"^/arxiv\.org/pdf/(.+?)(?:\.pdf)?$", parsed.path)
+        if m and m.group(1) in self.by_id:
+            time.sleep(self.pdf_latency)
+            body = self._pdf(m.group(1))
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if handler.headers.get("If-None-Match") == etag:
+                self.send(handler, 304, b"", "application/pdf", {"ETag": etag})
+                return
+            with self._lock:
+                self.pdf_downloads += 1
+            self.send(handler, 200, body, "application/pdf", {"ETag": etag})
+            return
+        self.send(handler, 404, b"not found", "text/plain")
+
+    def search(self, search_query: str) -> List[Paper]:
+        clauses = _query_clauses(search_query)
+        hits = []
+        for p in self.corpus:
+            text = f"{p.title} {p.abstract}".lower()
+            if any(all(t in text for t in terms) for terms in clauses):
+                hits.append(p)
+        return hits
+
+    def _feed(self, qs: Dict[str, List[str]]) -> bytes:
+        hits = self.search(qs.get("search_query", [""])[0])
+        start = int(qs.get("start", ["0"])[0])
+        size = int(qs.get("max_results", ["10"])[0])
+        page = hits[start:start + size]
+        entries = "".join(self._entry(p) for p in page)
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom" '
+            'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" '
+            'xmlns:arxiv="http://arxiv.org/schemas/atom">'
+            f"<id>{self.url}/api/query</id><title>ArXiv Query</title>"
+            f"<updated>{datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}</updated>"
+            f"<opensearch:totalResults>{len(hits)}</opensearch:totalResults>"
+            f"<opensearch:startIndex>{start}</opensearch:startIndex>"
+            f"<opensearch:itemsPerPage>{size}</opensearch:itemsPerPage>"
+            f"{entries}</feed>"
+        ).encode("utf-8")
+
+    def _list_records(self, qs: Dict[str, List[str]]) -> bytes:
+        """OAI-PMH ListRecords (metadataPrefix=arXivRaw); the datestamp of a paper is its submission day."""
+        token = qs.get("resumptionToken", [""])[0]
+        since, offset = (token.split("|") if token else (qs.get("from", [""])[0], "0"))
+        offset = int(offset)
+        hits = [p for p in reversed(self.corpus) if p.published.strftime("%Y-%m-%d") >= since]
+        page = hits[offset:offset + self.oai_page_size]
+        more = offset + len(page) < len(hits)
+        records = "".join(
+            "<record><header>"
+            f"<identifier>oai:arXiv.org:{p.arxiv_id.rsplit('v', 1)[0]}</identifier>"
+            f"<datestamp>{p.published:%Y-%m-%d}</datestamp><setSpec>cs</setSpec></header>"
+            '<metadata><arXivRaw xmlns="http://arxiv.org/OAI/arXivRaw/">'
+            f"<id>{p.arxiv_id.rsplit('v', 1)[0]}</id><submitter>Anonymous Author</submitter>"
+            f'<version version="v1"><date>{format_datetime(p.published, usegmt=True)}</date><size>1kb</size></version>'
+            f"<title>{escape(p.title)}</title><authors>Anonymous Author</authors>"
+            f"<categories>cs.CV cs.LG</categories><abstract>{escape(p.abstract)}</abstract>"
+            "</arXivRaw></metadata></record>"
+            for p in page
+        )
+        body = (f"<ListRecords>{records}<resumptionToken>{since}|{offset + len(page)}</resumptionToken></ListRecords>"
+                if more else f"<ListRecords>{records}</ListRecords>")
+        if not hits:
+            body = '<error code="noRecordsMatch">No records</error>'
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            f"<responseDate>{datetime.utcnow():%Y-%m-%dT%H:%M:%SZ}</responseDate>"
+            f'<request verb="ListRecords">{self.url}/oai2</request>{body}</OAI-PMH>'
+        ).encode("utf-8")
+
+    def _entry(self, p: Paper) -> str:
+        ts = p.published.strftime("%Y-%m-%dT%H:%M:%SZ")
+        base = f"{self.url}/arxiv.org"
+        return (
+            "<entry>"
+            f"<id>{base}/abs/{p.arxiv_id}</id>"
+            f"<updated>{ts}</updated><published>{ts}</published>"
+            f"<title>{escape(p.title)}</title><summary>{escape(p.abstract)}</summary>"
+            "<author><name>Anonymous Author</name></author>"
+            f'<link href="{base}/abs/{p.arxiv_id}" rel="alternate" type="text/html"/>'
+            f'<link title="pdf" href="{base}/pdf/{p.arxiv_id}" rel="related" type="application/pdf"/>'
+            '<arxiv:primary_category term="cs.CV" scheme="http://arxiv.org/schemas/atom"/>'
+            '<category term="cs.CV" scheme="http://arxiv.org/schemas/atom"/>'
+            "</entry>"
+        )
+
+
+# ------------ OpenAI ------------
+_SHAPE_MARKER = "Return JSON exactly in this shape:\n"
+
+
+class FakeOpenAI(_Server):
+    """
+    Answers every chat completion with the JSON shape found in the system prompt. Each "string" leaf
+    is filled with probability fill_rate (else "N/A"), deterministically per chunk, so early stopping
+    and merging see realistic partial summaries.
+    """
+
+    def __init__(
+        self,
+        latency: float = 1.0,
+        ms_per_1k_tokens: float = 20.0,
+        error_rate: float = 0.0,
+        max_in_flight: int = 0,
+        retry_after: Optional[float] = 0.5,
+        fill_rate: float = 0.7,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+        self.error_rate = error_rate
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.fill_rate = fill_rate
+        self.seed = seed
+        self.in_flight = 0
+        self.completions = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self._prefixes: set = set()
+        self._rng = random.Random(seed)
+
+    @property
+    def base_url(self) -> str:
+        return self.url + "/v1"
+
+    def _fill(self, shape: Any, rng: random.Random) -> Any:
+        if isinstance(shape, dict):
+            return {k: self._fill(v, rng) for k, v in shape.items()}
+        if isinstance(shape, list):
+            return [self._fill(v, rng) for v in shape]
+        if rng.random() >= self.fill_rate:
+            return "N/A"
+        return "Synthetic summary sentence %d." % rng.randrange(1000)
+
+    def _reject(self, handler, reason: str):
+        with self._lock:
+            self.rate_limited += 1
+        headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+        body = json.dumps({"error": {"message": reason, "type": "rate_limit_error", "code": "rate_limit_exceeded"}})
+        self.send(handler, 429, body.encode(), "application/json", headers)
+
+    def handle(self, handler):
+        self.count()
+        if urlparse(handler.path).path != "/v1/chat/completions":
+            self.send(handler, 404, b"{}", "application/json")
+            return
+        req = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", "0"))) or b"{}")
+
+        with self._lock:
+            overloaded = self.max_in_flight and self.in_flight >= self.max_in_flight
+            unlucky = self._rng.random() < self.error_rate
+            if not (overloaded or unlucky):
+                self.in_flight += 1
+        if overloaded or unlucky:
+            self._reject(handler, "Rate limit reached (fake)")
+            return
+        try:
+            self._complete(handler, req)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _complete(self, handler, req: Dict[str, Any]):
+        messages = req.get("messages", [])
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        prompt = "".join(m.get("content") or "" for m in messages)
+        prompt_tokens = max(1, len(prompt) // 4)
+
+        # like the real prompt cache: prefixes >= 1024 tokens, in 128-token steps, after a first request
+        prefix_tokens = len(system) // 4
+        with self._lock:
+            seen = system in self._prefixes
+            self._prefixes.add(system)
+        cached = (prefix_tokens // 128) * 128 if seen and prefix_tokens >= 1024 else 0
+
+        time.sleep(self.latency + self.ms_per_1k_tokens * prompt_tokens / 1e6)
+
+        try:
+            shape = json.loads(system.split(_SHAPE_MARKER, 1)[1])
+        except (IndexError, ValueError):
+            shape = {"answer": "string"}
+        rng = random.Random(f"{self.seed}:{hashlib.sha1(prompt.encode()).hexdigest()}")
+        content = json.dumps(self._fill(shape, rng))
+        completion_tokens = max(1, len(content) // 4)
+
+        with self._lock:
+            self.completions += 1
+            self.prompt_tokens += prompt_tokens
+        body = {
+            "id": f"chatcmpl-fake-{self.completions}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+        self.send(handler, 200, json.dumps(body).encode(), "application/json")
+
+
+# ------------ Google (Calendar, Gmail) ------------
+class _Call:
+    def __init__(self, fn, latency: float):
+        self._fn = fn
+        self._latency = latency
+
+    def execute(self):
+        time.sleep(self._latency)
+        return self._fn()
+
+
+class FakeCalendarAPI(_Server):
+    """
+    Local stub of the Calendar API events endpoint (GET /calendar/v3/calendars/<id>/events), with
+    paging, syncToken incremental sync and 410 for expired tokens. Point calendar_bot at it with
+    CALENDAR_API_ENDPOINT=<api.endpoint>.
+
+    Every change bumps a version counter; sync tokens are "v<version>" and return the events
+    changed after that version (cancelled ones included, as tombstones).
+    """
+
+    def __init__(self, n_events: int = 5, history: int = 0, latency: float = 0.2):
+        super().__init__()
+        self.latency = latency
+        self.version = 0
+        self.min_token = 0  # tokens older than this are expired (410)
+        self.calendars: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self.items_sent = 0
+        self.bytes_sent = 0
+        today = datetime.now().astimezone().replace(hour=9, minute=0, second=0, microsecond=0)
+        for i in range(history):  # past events: what a full sync has to transfer once
+            self.put_event("primary", today - timedelta(days=1 + i // 3, hours=i % 3), f"Old meeting {i}")
+        for i in range(n_events):
+            self.put_event("primary", today + timedelta(hours=i), f"Meeting {i}", location="Room %d" % (100 + i))
+
+    @property
+    def endpoint(self) -> str:
+        return self.url + "/calendar/v3/"
+
+    def put_event(self, calendar_id: str, start: datetime, summary: str, minutes: int = 30, **fields) -> str:
+        with self._lock:
+            self.version += 1
+            event_id = fields.pop("id", None) or f"evt{self.version}"
+            self.calendars[calendar_id][event_id] = {
+                "id": event_id,
+                "status": "confirmed",
+                "summary": summary,
+                "start": {"dateTime": start.isoformat()},
+                "end": {"dateTime": (start + timedelta(minutes=minutes)).isoformat()},
+                "htmlLink": f"https://calendar.example/event/{event_id}",
+                "_version": self.version,
+                **fields,
+            }
+            return event_id
+
+    def cancel_event(self, calendar_id: str, event_id: str):
+        with self._lock:
+            self.version += 1
+            ev = self.calendars[calendar_id][event_id]
+            ev.update(status="cancelled", _version=self.version)
+
+    def expire_tokens(self):
+        with self._lock:
+            self.min_token = self.version + 1
+
+    def handle(self, handler):
+        self.count()
+        parsed = urlparse(handler.path)
+        m = re.match(r"^/calendar/v3/calendars/([^/]+)/events$", parsed.path)
+        if not m:
+            self.send(handler, 404, b"{}", "application/json")
+            return
+        time.sleep(self.latency)
+        calendar_id = unquote(m.group(1))
+        qs = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        with self._lock:
+            events = sorted(self.calendars[calendar_id].values(), key=lambda e: e["_version"])
+            token = qs.get("syncToken")
+            if token:
+                since = int(token.lstrip("v"))
+                if since < self.min_token:
+                    body = json.dumps({"error": {"code": 410, "message": "Sync token is no longer valid, "
+                                                                         "a full sync is required."}})
+                    self.send(handler, 410, body.encode(), "application/json")
+                    return
+                events = [e for e in events if e["_version"] > since]
+            else:
+                events = [e for e in events if e["status"] != "cancelled"]
+            start = int(qs.get("pageToken", "0"))
+            size = int(qs.get("maxResults", "250"))
+            page = events[start:start + size]
+            out: Dict[str, Any] = {"kind": "calendar#events",
+                                   "items": [{k: v for k, v in e.items() if k != "_version"} for e in page]}
+            if start + size < len(events):
+                out["nextPageToken"] = str(start + size)
+            else:
+                out["nextSyncToken"] = f"v{self.version}"
+            body = json.dumps(out).encode()
+            self.items_sent += len(page)
+            self.bytes_sent += len(body)
+        self.send(handler, 200, body, "application/json")
+
+
+class FakeGmailService:
+    """Mimics build("gmail", "v1"): users().messages().send(...).execute() records the raw message."""
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.sent: List[Dict[str, Any]] = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId: str, body: Dict[str, Any]):
+        def _send():
+            self.sent.append(body)
+            return {"id": f"msg{len(self.sent)}", "labelIds": ["SENT"]}
+        return _Call(_send, self.latency)
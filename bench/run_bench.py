@@ -0,0 +1,273 @@
+# bench/run_bench.py
+"""
+Offline end-to-end benchmark: runs main.main() against local fakes (no network, no API costs).
+
+    python bench/run_bench.py --keywords 6 --per-keyword 3 --pages 10 --llm-latency 1.0
+
+Every run gets a fresh working directory (and .cache) unless --runs > 1, in which case the runs
+share it, so later runs measure the warm path (seen index, high-water marks, summary/PDF caches).
+Reports per-stage wall time (union of the intervals in which the stage was active, so concurrent
+calls are not double counted), papers per minute and peak RSS of the process and its children.
+
+The digest's own knobs are read from the environment as usual (DIGEST_MAX_WORKERS, LLM_RPM, ...);
+--set KEY=VALUE sets them before the repo modules are imported.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from corpus import build_corpus  # noqa: E402
+from fakes import FakeArxiv, FakeCalendarAPI, FakeGmailService, FakeOpenAI  # noqa: E402
+
+STAGES = [
+    ("arxiv_fetch", "arXiv API pages"),
+    ("arxiv_mirror", "arXiv mirror harvest+match"),
+    ("pdf_download", "PDF downloads"),
+    ("pdf_extract", "PDF text extraction"),
+    ("chunking", "chunking + pruning"),
+    ("llm", "chat completions"),
+    ("summarize", "summarize_pdf (per paper)"),
+    ("digest", "run_daily_digest"),
+    ("markdown", "markdown -> HTML"),
+    ("calendar", "calendar fetch"),
+    ("email", "email send"),
+]
+
+
+# ------------ Stage timing ------------
+class StageTimer:
+    def __init__(self):
+        self.intervals: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def wrap(self, owner, name: str, stage: str):
+        fn = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.intervals[stage].append((t0, time.perf_counter()))
+
+        timed.__wrapped__ = fn
+        setattr(owner, name, timed)
+
+    def reset(self):
+        with self._lock:
+            self.intervals.clear()
+
+    def report(self, stage: str) -> Tuple[float, float, int]:
+        """(wall seconds the stage was active, summed call seconds, calls)"""
+        spans = sorted(self.intervals.get(stage, []))
+        wall, busy, end = 0.0, 0.0, float("-inf")
+        for s, e in spans:
+            busy += e - s
+            if e > end:
+                wall += e - max(s, end)
+                end = e
+        return wall, busy, len(spans)
+
+
+def _peak_rss_mb() -> Tuple[float, float]:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--keywords", type=int, default=4, help="keywords (split over two topics)")
+    ap.add_argument("--per-keyword", type=int, default=3, help="corpus papers per keyword")
+    ap.add_argument("--max-results", type=int, default=3, help="main.MAX_RESULTS")
+    ap.add_argument("--pages", type=int, default=8, help="pages per generated PDF")
+    ap.add_argument("--runs", type=int, default=1, help="consecutive runs sharing one workdir/cache")
+    ap.add_argument("--arxiv-latency", type=float, default=0.3, help="seconds per API page")
+    ap.add_argument("--arxiv-source", choices=["api", "mirror"], default="api",
+                    help="search API per (batched) query, or the local metadata mirror harvested over OAI-PMH")
+    ap.add_argument("--arxiv-delay", type=float, default=0.0, help="arxiv.Client delay_seconds (production: 3)")
+    ap.add_argument("--pdf-latency", type=float, default=0.1, help="seconds per PDF download")
+    ap.add_argument("--llm-latency", type=float, default=1.0, help="seconds per chat completion")
+    ap.add_argument("--llm-ms-per-1k", type=float, default=20.0, help="extra ms per 1k prompt tokens")
+    ap.add_argument("--llm-429-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    ap.add_argument("--llm-max-in-flight", type=int, default=0, help="429 above this many concurrent requests (0 = off)")
+    ap.add_argument("--llm-fill-rate", type=float, default=0.7, help="fraction of summary fields the fake fills")
+    ap.add_argument("--events", type=int, default=5, help="calendar events today")
+    ap.add_argument("--calendar-history", type=int, default=200, help="past events a full calendar sync transfers")
+    ap.add_argument("--google-latency", type=float, default=0.2, help="seconds per Calendar/Gmail call")
+    ap.add_argument("--subscribers", type=int, default=0,
+                    help="subscribers with overlapping halves of the keywords (0 = the single default one)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="environment for the digest")
+    ap.add_argument("--workdir", help="keep the working directory here instead of a temp dir")
+    ap.add_argument("--json", help="also write the report as JSON to this path")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    words = ["avatar", "video understanding", "model collapse", "neural rendering", "gaussian splatting",
+             "diffusion", "point cloud", "pose estimation", "optical flow", "scene graph", "depth", "segmentation"]
+    keywords = [words[i % len(words)] + ("" if i < len(words) else f" v{i // len(words)}")
+                for i in range(args.keywords)]
+    corpus = build_corpus(keywords, args.per_keyword, args.pages, args.seed)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="workflow-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copy(os.path.join(REPO_ROOT, "template.html"), workdir)
+
+    arxiv_srv = FakeArxiv(corpus, latency=args.arxiv_latency, pdf_latency=args.pdf_latency).start()
+    llm_srv = FakeOpenAI(
+        latency=args.llm_latency,
+        ms_per_1k_tokens=args.llm_ms_per_1k,
+        error_rate=args.llm_429_rate,
+        max_in_flight=args.llm_max_in_flight,
+        fill_rate=args.llm_fill_rate,
+        seed=args.seed,
+    ).start()
+    calendar_srv = FakeCalendarAPI(n_events=args.events, history=args.calendar_history,
+                                   latency=args.google_latency).start()
+
+    # env first: the repo reads its configuration at import time
+    os.environ.update({
+        "WORKFLOW_CACHE_DIR": os.path.join(workdir, ".cache"),
+        "LLM_BASE_URL": llm_srv.base_url,
+        "CALENDAR_API_ENDPOINT": calendar_srv.endpoint,
+        "ARXIV_SOURCE": args.arxiv_source,
+        "ARXIV_OAI_URL": arxiv_srv.url + "/oai2",
+        "ARXIV_MIRROR_URL": arxiv_srv.url + "/arxiv.org",
+        "OPENAI_API_KEY": "bench",
+        "EMAIL_FROM": "bench@example.com",
+        "EMAIL_TO": "bench@example.com",
+    })
+    if args.subscribers:
+        width = (len(keywords) + 1) // 2
+        step = max(1, len(keywords) // args.subscribers)
+        os.environ["SUBSCRIBERS"] = json.dumps([
+            {"name": f"sub{i}", "email": f"sub{i}@example.com",
+             "keywords": [keywords[(i * step + j) % len(keywords)] for j in range(width)],
+             "calendar_ids": ["primary", f"team{i % 2}"]}
+            for i in range(args.subscribers)
+        ])
+    for item in args.set:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+    import arxiv
+    import arxiv_bot
+    import calendar_bot
+    import email_bot
+    import llm_backend
+    import main as digest
+    import openai_bot
+    import pdf_tools
+    import render
+
+    arxiv.Client.query_url_format = arxiv_srv.query_url_format
+    make_client = arxiv_bot.make_client
+    arxiv_bot.make_client = lambda page_size=3, delay_seconds=3, num_retries=3: make_client(
+        page_size, args.arxiv_delay, num_retries)
+
+    gmail = FakeGmailService(latency=args.google_latency)
+    email_bot._authorize = lambda: None
+    email_bot.build = lambda *a, **kw: gmail
+
+    half = (len(keywords) + 1) // 2
+    digest.KEYWORDS = {"topic A": keywords[:half], "topic B": keywords[half:]}
+    digest.MAX_RESULTS = args.max_results
+
+    timer = StageTimer()
+    timer.wrap(arxiv.Client, "_parse_feed", "arxiv_fetch")
+    timer.wrap(arxiv_bot, "get_papers_mirrored", "arxiv_mirror")
+    timer.wrap(pdf_tools, "download", "pdf_download")
+    timer.wrap(openai_bot, "extract_text", "pdf_extract")
+    timer.wrap(openai_bot, "make_chunks", "chunking")
+    timer.wrap(openai_bot, "prune_chunks", "chunking")
+    timer.wrap(llm_backend, "chat_completion", "llm")
+    timer.wrap(openai_bot, "summarize_pdf", "summarize")
+    timer.wrap(arxiv_bot, "run_daily_digest", "digest")
+    timer.wrap(render, "render_fragments", "markdown")
+    timer.wrap(calendar_bot, "fetch_events_by_calendar", "calendar")
+    timer.wrap(email_bot, "send_email", "email")
+
+    reports = []
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for run in range(1, args.runs + 1):
+            timer.reset()
+            before = dict(queries=arxiv_srv.queries, oai=arxiv_srv.oai_requests, pdfs=arxiv_srv.pdf_downloads,
+                          completions=llm_srv.completions, rate_limited=llm_srv.rate_limited,
+                          emails=len(gmail.sent), cal_items=calendar_srv.items_sent,
+                          cal_bytes=calendar_srv.bytes_sent)
+            t0 = time.perf_counter()
+            digest.main([])
+            total = time.perf_counter() - t0
+
+            papers = timer.report("summarize")[2]
+            own, children = _peak_rss_mb()
+            reports.append({
+                "run": run,
+                "total_s": round(total, 3),
+                "papers": papers,
+                "papers_per_min": round(papers / total * 60, 2) if total else 0.0,
+                "peak_rss_mb": round(own, 1),
+                "peak_rss_children_mb": round(children, 1),
+                "stages": {
+                    stage: dict(zip(("wall_s", "busy_s", "calls"), (round(w, 3), round(b, 3), n)))
+                    for stage, _ in STAGES for w, b, n in [timer.report(stage)]
+                },
+                "arxiv_queries": arxiv_srv.queries - before["queries"],
+                "oai_requests": arxiv_srv.oai_requests - before["oai"],
+                "pdf_downloads": arxiv_srv.pdf_downloads - before["pdfs"],
+                "llm_completions": llm_srv.completions - before["completions"],
+                "llm_429s": llm_srv.rate_limited - before["rate_limited"],
+                "email_bytes": len(gmail.sent[-1]["raw"]) if len(gmail.sent) > before["emails"] else 0,
+                "calendar_items": calendar_srv.items_sent - before["cal_items"],
+                "calendar_bytes": calendar_srv.bytes_sent - before["cal_bytes"],
+            })
+    finally:
+        os.chdir(cwd)
+        arxiv_srv.stop()
+        llm_srv.stop()
+        calendar_srv.stop()
+
+    for r in reports:
+        print(f"\n[bench] run {r['run']}: {r['papers']} papers in {r['total_s']:.2f}s "
+              f"= {r['papers_per_min']:.1f} papers/min; peak RSS {r['peak_rss_mb']:.0f} MB "
+              f"(children {r['peak_rss_children_mb']:.0f} MB)")
+        print(f"  {'stage':<28}{'wall s':>9}{'busy s':>9}{'calls':>7}")
+        for stage, label in STAGES:
+            s = r["stages"][stage]
+            print(f"  {label:<28}{s['wall_s']:>9.2f}{s['busy_s']:>9.2f}{s['calls']:>7}")
+        print(f"  arXiv queries {r['arxiv_queries']} (+{r['oai_requests']} OAI-PMH pages), PDF downloads {r['pdf_downloads']}, "
+              f"LLM completions {r['llm_completions']} ({r['llm_429s']} x 429), email {r['email_bytes']} bytes")
+        print(f"  calendar: {r['calendar_items']} events / {r['calendar_bytes']} bytes transferred")
+    print(f"\n[bench] LLM backend: {llm_backend.stats}; usage: {llm_backend.usage}")
+    print(f"[bench] workdir: {workdir}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "runs": reports}, f, indent=2)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
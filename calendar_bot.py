@@ -10,20 +10,48 @@ Setup:
 3) Optional environment variables:
    - CALENDAR_TIMEZONE: IANA timezone string (default "Europe/London")
    - CALENDAR_ID: calendar ID to fetch (default 'primary')
+   - CALENDAR_IDS: comma-separated calendar IDs to combine (team, rooms, shared, ...); overrides CALENDAR_ID
+   - CALENDAR_SYNC: 1 (default) = incremental sync into a local event cache; 0 = list today's events every run
+   - CALENDAR_API_ENDPOINT: test mode, talk to a local stub of the events endpoint without OAuth,
+     e.g. "http://127.0.0.1:8085/calendar/v3/"
+
+Sync engine: the first run lists every event of the calendar once (no time window, which the
+Calendar API requires for sync tokens) into <cache>/calendar.sqlite; later runs send the stored
+syncToken and only receive events that changed since. An expired token (HTTP 410) triggers a
+full resync. Today's events are then read from the local cache.
+The Google client libraries are only imported when a service is built, so reading the cache
+offline (fetch_events_by_calendar(..., offline=True)) starts fast and needs no credentials.
+
+Several calendars are fetched concurrently (one service per thread: httplib2 connections are not
+thread-safe) and merged by start time in one pass.
 """
 
+import heapq
+import json
 import os
-from datetime import datetime, timedelta, timezone
-from typing import List, Dict
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Dict, Tuple
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
+import tracing
+from utils import cache_path, discovery_document
 
 SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
 CRED_PATH = os.getenv("CALENDAR_CREDENTIALS_PATH", "credentials_calendar.json")
 TOKEN_PATH = os.getenv("CALENDAR_TOKEN_PATH", "token_calendar.json")
+SYNC = os.getenv("CALENDAR_SYNC", "1") == "1"
+API_ENDPOINT = os.getenv("CALENDAR_API_ENDPOINT", "")
+PAGE_SIZE = 2500  # events per page (API maximum)
+MAX_WORKERS = 8  # calendars fetched in parallel
+
+_local = threading.local()
+_doc = None
+_creds = None
+_creds_lock = threading.Lock()
+_doc_lock = threading.Lock()
+_pool: ThreadPoolExecutor | None = None  # kept for the life of the process, and with it each thread's service
 
 
 def _get_tz() -> timezone:
@@ -36,7 +64,11 @@ def _get_tz() -> timezone:
         return timezone.utc
 
 
-def _authorize():
+def _load_credentials():
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     creds = None
     if os.path.exists(TOKEN_PATH):
         creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
@@ -53,30 +85,234 @@ def _authorize():
     return creds
 
 
-def fetch_todays_events(calendar_id: str | None = None) -> List[Dict]:
+def _authorize():
+    """OAuth credentials, loaded once per process; the services refresh the access token when it expires."""
+    global _creds
+    with _creds_lock:
+        if _creds is None:
+            _creds = _load_credentials()
+        return _creds
+
+
+def _discovery_doc() -> str:
+    """Calendar discovery document, read (or downloaded) once per process, whichever thread asks first."""
+    global _doc
+    with _doc_lock:
+        if _doc is None:
+            _doc = discovery_document("calendar", "v3")
+        return _doc
+
+
+def get_service():
     """
-    读取当天（本地时区）所有单次展开后的事件，按开始时间排序。
-    返回 events 原始列表（Google Calendar Events 资源的子集）。
+    Calendar service built from the locally cached discovery document, once per thread
+    (the authorized HTTP client refreshes the OAuth token by itself).
     """
+    service = getattr(_local, "service", None)
+    if service is None:
+        from googleapiclient.discovery import build_from_document
+
+        doc = _discovery_doc()
+        if API_ENDPOINT:
+            import httplib2
+            service = build_from_document(doc, http=httplib2.Http(), client_options={"api_endpoint": API_ENDPOINT})
+        else:
+            service = build_from_document(doc, credentials=_authorize())
+        _local.service = service
+    return service
+
+
+def configured_calendar_ids() -> List[str]:
+    ids = [c.strip() for c in os.getenv("CALENDAR_IDS", "").split(",") if c.strip()]
+    return ids or [os.getenv("CALENDAR_ID", "primary")]
+
+
+# ------------ Local event cache ------------
+def _timestamp(tobj: Dict) -> float | None:
+    val = tobj.get("dateTime")
+    return datetime.fromisoformat(val.replace("Z", "+00:00")).timestamp() if val else None
+
+
+class EventCache:
+    """Events of each synced calendar plus its syncToken, in <cache>/calendar.sqlite."""
+
+    def __init__(self):
+        self._conn = sqlite3.connect(cache_path("calendar.sqlite"), timeout=30)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                start_ts REAL,      -- timed events
+                end_ts REAL,
+                start_date TEXT,    -- all-day events (end_date exclusive)
+                end_date TEXT,
+                body TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, event_id)
+            );
+            CREATE INDEX IF NOT EXISTS events_start ON events (calendar_id, start_ts);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT NOT NULL,
+                synced TEXT NOT NULL
+            );
+            """
+        )
+
+    def close(self):
+        self._conn.close()
+
+    def sync_token(self, calendar_id: str) -> str | None:
+        row = self._conn.execute("SELECT sync_token FROM sync_state WHERE calendar_id = ?", (calendar_id,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, service, calendar_id: str) -> Tuple[int, bool]:
+        """Bring the cache up to date. Returns (events received, whether it was a full sync)."""
+        from googleapiclient.errors import HttpError
+
+        token = self.sync_token(calendar_id)
+        if token:
+            try:
+                return self._sync(service, calendar_id, token), False
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                print(f"[calendar] sync token of {calendar_id} expired, full resync")
+        return self._sync(service, calendar_id, None), True
+
+    def _sync(self, service, calendar_id: str, token: str | None) -> int:
+        params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": PAGE_SIZE}
+        if token:
+            params["syncToken"] = token
+        items: List[Dict] = []
+        page_token = None
+        while True:
+            resp = service.events().list(**params, **({"pageToken": page_token} if page_token else {})).execute()
+            items += resp.get("items", [])
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                break
+
+        # apply everything in one transaction, so an interrupted sync leaves the old state + token
+        with self._conn:
+            if token is None:
+                self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            for ev in items:
+                if ev.get("status") == "cancelled":
+                    self._conn.execute("DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                                       (calendar_id, ev["id"]))
+                    continue
+                start, end = ev.get("start", {}), ev.get("end", {})
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (calendar_id, ev["id"], _timestamp(start), _timestamp(end),
+                     start.get("date"), end.get("date"), json.dumps(ev, ensure_ascii=False)),
+                )
+            if resp.get("nextSyncToken"):
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                    (calendar_id, resp["nextSyncToken"], datetime.now(timezone.utc).isoformat()),
+                )
+        return len(items)
+
+    def events_between(self, calendar_id: str, start: datetime, end: datetime) -> List[Dict]:
+        """Events overlapping [start, end) (all-day events by local date), ordered by start time."""
+        first_day = start.date().isoformat()
+        last_day = (end - timedelta(microseconds=1)).date().isoformat()
+        rows = self._conn.execute(
+            """
+            SELECT body FROM events WHERE calendar_id = ? AND (
+                (start_ts < ? AND end_ts > ?) OR (start_date <= ? AND end_date > ?)
+            )
+            """,
+            (calendar_id, end.timestamp(), start.timestamp(), last_day, first_day),
+        ).fetchall()
+        events = [json.loads(body) for (body,) in rows]
+        return sorted(events, key=lambda ev: _start_key(ev, start.tzinfo))
+
+
+def _start_key(ev: Dict, tz) -> float:
+    ts = _timestamp(ev.get("start", {}))
+    if ts is not None:
+        return ts
+    d = date.fromisoformat(ev["start"]["date"])
+    return datetime(d.year, d.month, d.day, tzinfo=tz).timestamp()
+
+
+def _fetch_calendar(calendar_id: str, start: datetime, end: datetime, offline: bool = False) -> List[Dict]:
+    """Events of one calendar overlapping [start, end), ordered by start time."""
+    with tracing.span("calendar.fetch", calendar_id=calendar_id, offline=offline) as sp:
+        if SYNC or offline:
+            cache = EventCache()
+            try:
+                received, full = (0, False) if offline else cache.sync(get_service(), calendar_id)
+                items = cache.events_between(calendar_id, start, end)
+            finally:
+                cache.close()
+            sp.set(received=received, full_sync=full)
+        else:
+            events_result = get_service().events().list(
+                calendarId=calendar_id,
+                timeMin=start.isoformat(),
+                timeMax=end.isoformat(),
+                singleEvents=True,
+                orderBy="startTime",
+            ).execute()
+            items = events_result.get("items", [])
+        sp.set(events=len(items))
+    return items
+
+
+def _day_window(day: date | None = None) -> Tuple[datetime, datetime]:
     tz = _get_tz()
-    now = datetime.now(tz)
-    start_of_day = datetime(now.year, now.month, now.day, 0, 0, 0, tzinfo=tz)
-    end_of_day = start_of_day + timedelta(days=1)
+    day = day or datetime.now(tz).date()
+    start_of_day = datetime(day.year, day.month, day.day, 0, 0, 0, tzinfo=tz)
+    return start_of_day, start_of_day + timedelta(days=1)
+
+
+def fetch_events_by_calendar(
+    calendar_ids: List[str], offline: bool = False, day: date | None = None
+) -> Dict[str, List[Dict]]:
+    """
+    calendar id -> events of that calendar today (or on `day`), ordered by start; calendars are fetched
+    concurrently. offline=True only reads the local event cache: no OAuth, no network (as of the last sync).
+    """
+    start_of_day, end_of_day = _day_window(day)
+    ids = list(dict.fromkeys(calendar_ids))
+    if len(ids) <= 1:
+        return {cid: _fetch_calendar(cid, start_of_day, end_of_day, offline) for cid in ids}
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="calendar")
+    return dict(zip(ids, _pool.map(lambda cid: _fetch_calendar(cid, start_of_day, end_of_day, offline), ids)))
 
-    creds = _authorize()
-    service = build("calendar", "v3", credentials=creds)
 
-    calendar_id = calendar_id or os.getenv("CALENDAR_ID", "primary")
+def merge_events(per_calendar: List[List[Dict]]) -> List[Dict]:
+    """
+    Merge per-calendar lists by start time; an event found in several calendars is kept once.
+    Instances of a recurring event share its iCalUID, so an event is identified by iCalUID plus the
+    (original) start of the instance: two stand-ups of one series on the same day both stay.
+    """
+    tz = _get_tz()
+    events, seen = [], set()
+    for ev in heapq.merge(*per_calendar, key=lambda ev: _start_key(ev, tz)):
+        instance = {"start": ev.get("originalStartTime") or ev.get("start", {})}
+        uid = (ev.get("iCalUID") or ev.get("id"), _start_key(instance, tz))
+        if uid in seen:
+            continue
+        seen.add(uid)
+        events.append(ev)
+    return events
 
-    events_result = service.events().list(
-        calendarId=calendar_id,
-        timeMin=start_of_day.isoformat(),
-        timeMax=end_of_day.isoformat(),
-        singleEvents=True,
-        orderBy="startTime",
-    ).execute()
 
-    return events_result.get("items", [])
+def fetch_todays_events(calendar_id: str | None = None, calendar_ids: List[str] | None = None) -> List[Dict]:
+    """
+    读取当天（本地时区）所有单次展开后的事件，按开始时间排序。
+    多个日历并发获取，按开始时间归并；同一事件出现在多个日历中时只保留一次。
+    返回 events 原始列表（Google Calendar Events 资源的子集）。
+    """
+    ids = calendar_ids or ([calendar_id] if calendar_id else configured_calendar_ids())
+    return merge_events(list(fetch_events_by_calendar(ids).values()))
 
 
 def events_to_markdown(events: List[Dict]) -> str:
@@ -0,0 +1,110 @@
+# compact.py
+"""
+Email HTML compaction, run right before send_email.
+
+Gmail clips messages whose HTML is larger than ~102 KB ("[Message clipped] View entire message"),
+so the payload is:
+1) inline styles tightened in place (whitespace and empty declarations dropped); they stay inline,
+   since Gmail for non-Google accounts, older Outlook and many mobile apps ignore <style> blocks;
+2) minified: comments and whitespace between tags removed, runs of whitespace collapsed
+   (<pre>/<textarea> left untouched);
+3) fitted to a byte budget: if still too large, the last paper blocks are collapsed to their
+   title link, lowest priority (end of the digest) first.
+
+Environment variables:
+   - EMAIL_MAX_BYTES: HTML size budget in bytes (default 100000; 0 = no budget)
+"""
+
+import os
+import re
+from typing import Callable, Dict, List, Tuple
+
+from render import paper_heading, render_block
+
+MAX_BYTES = int(os.getenv("EMAIL_MAX_BYTES", "100000"))
+
+_STYLE_ATTR_RE = re.compile(r"""\sstyle\s*=\s*("([^"]*)"|'([^']*)')""", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[a-zA-Z][^<>]*>")
+_PRESERVE_RE = re.compile(r"(<(pre|textarea)\b.*?</\2>)", re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+
+
+def _normalize_style(style: str) -> str:
+    decls = [d.strip() for d in style.split(";") if d.strip()]
+    return ";".join(re.sub(r"\s*:\s*", ":", re.sub(r"\s+", " ", d), count=1) for d in decls)
+
+
+def tighten_styles(html: str) -> str:
+    """Rewrite every style="..." attribute without redundant whitespace; the styles stay inline."""
+
+    def _attr(m: re.Match) -> str:
+        quote = '"' if m.group(2) is not None else "'"
+        style = _normalize_style(m.group(2) if m.group(2) is not None else m.group(3))
+        return f" style={quote}{style}{quote}"
+
+    return _TAG_RE.sub(lambda m: _STYLE_ATTR_RE.sub(_attr, m.group(0)), html)
+
+
+def minify(html: str) -> str:
+    """Drop comments and collapse whitespace, leaving <pre>/<textarea> content as is."""
+    parts = _PRESERVE_RE.split(html)
+    out = []
+    # split() with two groups yields: text, whole-preserved, tag-name, text, ...
+    for i in range(0, len(parts), 3):
+        text = _COMMENT_RE.sub("", parts[i])
+        text = re.sub(r">\s*\n\s*<", "><", text)  # markup indentation; a plain space may separate inline tags
+        text = re.sub(r"\s{2,}", " ", text)
+        out.append(text)
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return "".join(out).strip()
+
+
+def compact(html: str) -> str:
+    return minify(tighten_styles(html))
+
+
+def fit_budget(
+    fragments: List[Tuple[str, str]],
+    page_fn: Callable[[str], str],
+    max_bytes: int = MAX_BYTES,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Build the email from (markdown, html) digest fragments. page_fn(arXiv_html) renders the full
+    page (template + calendar). Paper blocks are collapsed to title links from the end of the digest
+    until the compacted page fits max_bytes. Returns (html, report).
+    """
+    papers = [i for i, (md, _) in enumerate(fragments) if paper_heading(md)]
+    raw_bytes = len(page_fn("\n".join(h for _, h in fragments)).encode("utf-8"))
+
+    def _build(collapsed: int) -> str:
+        drop = set(papers[len(papers) - collapsed:]) if collapsed else set()
+        body = [render_block(paper_heading(md)) if i in drop else h for i, (md, h) in enumerate(fragments)]
+        if collapsed:
+            body.append(f"<p><em>{collapsed} of {len(papers)} summaries shortened to their title "
+                        f"to keep this email under {max_bytes // 1000} KB; see the daily digest file "
+                        f"for the full text.</em></p>")
+        return compact(page_fn("\n".join(body)))
+
+    html = _build(0)
+    collapsed = 0
+    if max_bytes and len(html.encode("utf-8")) > max_bytes and papers:
+        # size shrinks monotonically with the number of collapsed papers: binary search the fewest
+        lo, hi = 1, len(papers)
+        best = _build(hi)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = _build(mid)
+            if len(candidate.encode("utf-8")) <= max_bytes:
+                hi, best = mid, candidate
+            else:
+                lo = mid + 1
+        html, collapsed = (best, hi)
+    report = {
+        "raw_bytes": raw_bytes,
+        "bytes": len(html.encode("utf-8")),
+        "budget": max_bytes,
+        "papers": len(papers),
+        "collapsed": collapsed,
+    }
+    return html, report
\ No newline at end of file
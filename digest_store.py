@@ -0,0 +1,140 @@
+# digest_store.py
+"""
+Structured per-day digest store: YYYY/MM/DD.jsonl next to YYYY/MM/DD.md.
+
+One JSON record per line, in output order:
+   {"type": "header", "day": "2025-10-20", "max_results": 3}
+   {"type": "section", "keyword": "avatar"}
+   {"type": "no_results", "keyword": "avatar"}
+   {"type": "paper", "keyword": "avatar", "entry_id": ..., "pdf_url": ..., "title": ...,
+    "published": ..., "summary": {...merge_partials dict...} | null, "error": "..." | null}
+   {"type": "paper_ref", "keyword": "video understanding", "entry_id": ...}
+
+A paper listed under several keywords is written (and summarized) once, under the first one;
+the other keywords get a paper_ref. The day's markdown ignores refs, while a subscriber's view
+(select_records) shows the paper under each of their keywords that listed it.
+
+The store is the source of truth; the markdown file (and the email HTML) are renders of it, so a
+past day can be re-rendered locally without any LLM call (render_day). Days from before the
+store existed only have the .md file and are read as-is.
+"""
+
+import json
+import os
+from datetime import date
+from textwrap import dedent
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+Record = Dict[str, Any]
+
+
+def store_path(md_path: str) -> str:
+    return os.path.splitext(md_path)[0] + ".jsonl"
+
+
+def day_md_path(day: str | date, root: str = ".") -> str:
+    """'2025-10-20' -> ./2025/10/20.md"""
+    year, month, d = str(day).split("-")
+    return os.path.join(root, year, month, f"{d}.md")
+
+
+def append(path: str, records: Iterable[Record]):
+    lines = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def load(path: str) -> List[Record]:
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+# ------------ Markdown render target ------------
+def header_markdown(day: str, max_results: int) -> str:
+    return dedent(f"""\
+    # Daily Paper Digest · {day}
+    > Auto-generated: Recent submissions from arXiv are fetched by topic and keyword (up to {max_results} papers per query).
+    """)
+
+
+def paper_markdown(record: Record, summary_to_markdown_fn: Callable[[dict], str]) -> str:
+    head = f"\n### [{record['title']}]({record['pdf_url']})\n"
+    if record.get("error") is not None or record.get("summary") is None:
+        return head + f"  (summary failed: {record.get('error')})\n\n"
+    return head + "\n" + summary_to_markdown_fn(record["summary"])
+
+
+def record_markdown(record: Record, summary_to_markdown_fn: Callable[[dict], str]) -> str:
+    kind = record["type"]
+    if kind == "header":
+        return header_markdown(record["day"], record["max_results"])
+    if kind == "section":
+        return f"\n## {record['keyword']}\n"
+    if kind == "no_results":
+        return "- (No results)\n"
+    if kind == "paper":
+        return paper_markdown(record, summary_to_markdown_fn)
+    return ""
+
+
+def render_markdown(records: Iterable[Record], summary_to_markdown_fn: Callable[[dict], str]) -> str:
+    return "".join(record_markdown(r, summary_to_markdown_fn) for r in records)
+
+
+def select_records(records: List[Record], keywords: List[str]) -> List[Record]:
+    """
+    The day as seen by one subscriber: the header, then one section per keyword (in their order)
+    with every paper listed under it by any run of the day. A paper shows up once, under its
+    first keyword; of several records for a paper (a retry later that day) a successful one wins.
+    """
+    best: Dict[str, Record] = {}
+    for r in records:
+        if r["type"] == "paper" and (r.get("error") is None or r["entry_id"] not in best):
+            best[r["entry_id"]] = r
+    listed: Dict[str, Dict[str, None]] = {kw: {} for kw in keywords}
+    for r in records:
+        if r["type"] in ("paper", "paper_ref") and r.get("keyword") in listed and r["entry_id"] in best:
+            listed[r["keyword"]][r["entry_id"]] = None
+
+    out = [r for r in records[:1] if r["type"] == "header"]
+    shown = set()
+    for kw in keywords:
+        out.append({"type": "section", "keyword": kw})
+        papers = [dict(best[e], keyword=kw) for e in listed[kw] if e not in shown]
+        shown.update(p["entry_id"] for p in papers)
+        out.extend(papers or [{"type": "no_results", "keyword": kw}])
+    return out
+
+
+def load_day_markdown(md_path: str, summary_to_markdown_fn: Optional[Callable[[dict], str]] = None) -> str:
+    """Markdown of a day: rendered from its store, or the .md file itself for days without one."""
+    path = store_path(md_path)
+    if not os.path.exists(path):
+        with open(md_path, "r", encoding="utf-8") as f:
+            return f.read()
+    if summary_to_markdown_fn is None:
+        from openai_bot import summary_to_markdown as summary_to_markdown_fn
+    return render_markdown(load(path), summary_to_markdown_fn)
+
+
+def render_day(
+    day: str | date,
+    root: str = ".",
+    summary_to_markdown_fn: Optional[Callable[[dict], str]] = None,
+    write: bool = False,
+) -> str:
+    """
+    Re-render a past day ('YYYY-MM-DD') from its store. A pure local operation, e.g. after a
+    change to summary_to_markdown; write=True also rewrites the day's .md file.
+    """
+    md_path = day_md_path(day, root)
+    md = load_day_markdown(md_path, summary_to_markdown_fn)
+    if write and os.path.exists(store_path(md_path)):
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write(md)
+    return md
\ No newline at end of file
@@ -25,6 +25,8 @@ from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 
+import tracing
+
 SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
 CRED_PATH = os.getenv("GMAIL_CREDENTIALS_PATH", "credentials_gmail.json")
 TOKEN_PATH = os.getenv("GMAIL_TOKEN_PATH", "token_gmail.json")
@@ -47,6 +49,17 @@ def _authorize():
     return creds
 
 
+_service = None
+
+
+def get_service():
+    """Gmail service, built once per process (the credentials refresh the access token themselves)."""
+    global _service
+    if _service is None:
+        _service = build("gmail", "v1", credentials=_authorize())
+    return _service
+
+
 # def _create_message(
 #     sender: str,
 #     to: str,
@@ -149,8 +162,9 @@ def send_email(
         html_body=html_body,          # pass-through
     )
 
-    creds = _authorize()
-    service = build("gmail", "v1", credentials=creds)
-    import base64
-    raw = base64.urlsafe_b64encode(msg.as_bytes()).decode("utf-8")
-    service.users().messages().send(userId="me", body={"raw": raw}).execute()
+    with tracing.span("email.send", to=to) as sp:
+        service = get_service()
+        import base64
+        raw = base64.urlsafe_b64encode(msg.as_bytes()).decode("utf-8")
+        sp.set(bytes=len(raw))
+        service.users().messages().send(userId="me", body={"raw": raw}).execute()
\ No newline at end of file
@@ -0,0 +1,100 @@
+# journal.py
+"""
+Run journal: work-in-progress checkpoints for papers whose summary is not finished yet.
+
+A killed or timed-out run loses at most the chunk calls that were in flight. Per paper (versioned
+arXiv id + prompt fingerprint) the journal keeps, under <cache>/journal/<id>/<fingerprint>/:
+   - text.txt.gz: the extracted text (the PDF itself stays in pdf_tools' cache)
+   - chunks.jsonl: one line per finished chunk call, keyed by a hash of the chunk text
+Once the merged summary is in summary_cache the paper's journal is dropped. Paper-level progress
+is the day's digest store plus the seen index, so a resumed run skips every written paper.
+
+Environment variables:
+   - JOURNAL_MAX_AGE_DAYS: journals of papers untouched for longer are removed (default 7)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils import cache_path
+
+MAX_AGE_DAYS = float(os.getenv("JOURNAL_MAX_AGE_DAYS", "7"))
+
+
+def chunk_key(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+
+
+class PaperJournal:
+    def __init__(self, arxiv_id: str, fingerprint: str):
+        self.folder = os.path.dirname(cache_path("journal", arxiv_id.replace("/", "_"), fingerprint[:16], "x"))
+        self._text_path = os.path.join(self.folder, "text.txt.gz")
+        self._chunks_path = os.path.join(self.folder, "chunks.jsonl")
+        self._lock = threading.Lock()
+
+    def text(self) -> Optional[str]:
+        try:
+            with gzip.open(self._text_path, "rt", encoding="utf-8") as f:
+                return f.read()
+        except (FileNotFoundError, EOFError, OSError):
+            return None  # missing, or cut short by the crash we are recovering from
+
+    def save_text(self, text: str):
+        part = self._text_path + ".part"
+        with gzip.open(part, "wt", encoding="utf-8", compresslevel=1) as f:
+            f.write(text)
+        os.replace(part, self._text_path)
+
+    def partials(self) -> Dict[str, Any]:
+        """chunk_key -> partial summary of every chunk call that completed."""
+        done: Dict[str, Any] = {}
+        if not os.path.exists(self._chunks_path):
+            return done
+        with open(self._chunks_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line
+                done[rec["key"]] = rec["part"]
+        return done
+
+    def save_partial(self, key: str, part: Any):
+        line = json.dumps({"key": key, "part": part}, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock, open(self._chunks_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def finish(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        parent = os.path.dirname(self.folder)
+        if os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+
+
+def evict():
+    """Remove paper journals that were not touched for MAX_AGE_DAYS (e.g. papers that keep failing)."""
+    root = os.path.dirname(cache_path("journal", "x"))
+    cutoff = time.time() - MAX_AGE_DAYS * 86400
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        latest = max((os.path.getmtime(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files),
+                     default=os.path.getmtime(path))
+        if latest < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_evicted = False
+
+
+def open_paper(arxiv_id: str, fingerprint: str) -> PaperJournal:
+    global _evicted
+    if not _evicted:
+        _evicted = True
+        evict()
+    return PaperJournal(arxiv_id, fingerprint)
\ No newline at end of file
@@ -0,0 +1,279 @@
+# llm_backend.py
+"""
+LLM backend used by openai_bot.summarize_chunk.
+
+- One pooled client per process: HTTP keep-alive connections are shared by every chunk and thread.
+- A token bucket keeps requests/minute and tokens/minute under the account limits.
+- Concurrency adapts AIMD-style: halved on 429s / timeouts, +1 after a window of successes.
+- Backends are pluggable (register_backend / LLM_BACKEND). The OpenAI backend talks to any
+  OpenAI-compatible endpoint, e.g. a local stub server for offline load tests (LLM_BASE_URL).
+
+Environment variables:
+   - LLM_BACKEND: backend name (default "openai")
+   - LLM_BASE_URL: OpenAI-compatible endpoint (default: the SDK's OPENAI_BASE_URL / api.openai.com)
+   - LLM_RPM / LLM_TPM: requests and tokens per minute (default 500 / 200000; 0 = unlimited)
+   - LLM_MAX_CONCURRENCY: upper bound of the adaptive concurrency (default 8)
+   - LLM_MAX_RETRIES: retries on 429 / timeouts / 5xx (default 6)
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Type
+
+import tracing
+
+TIMEOUT = 90
+RPM = int(os.getenv("LLM_RPM", "500"))
+TPM = int(os.getenv("LLM_TPM", "200000"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+COMPLETION_TOKENS_ESTIMATE = 1500  # reserved per request until the real usage is known
+
+
+# ------------ Rate limiting ------------
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+        with self._cond:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                self._cond.wait((amount - self.tokens) / self.rate)
+
+    def refund(self, amount: float):
+        """Give back (or, if negative, take) tokens once the real cost is known."""
+        if self.capacity <= 0:
+            return
+        with self._cond:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+            self._cond.notify_all()
+
+
+class AdaptiveLimiter:
+    """Concurrency limit with additive increase / multiplicative decrease."""
+
+    def __init__(self, max_limit: int, initial: Optional[int] = None):
+        self.max_limit = max(1, max_limit)
+        self.limit = max(1, min(initial or self.max_limit, self.max_limit))
+        self.in_flight = 0
+        self._successes = 0
+        self._generation = 0  # bumped on every decrease
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        """Wait for a slot; returns a ticket to pass to on_overload."""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            return self._generation
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_overload(self, ticket: int):
+        with self._cond:
+            # requests started before the last decrease fail together: only the first of them counts
+            if ticket != self._generation:
+                return
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            self._generation += 1
+
+
+# ------------ Usage accounting ------------
+class UsageTally:
+    """Thread-safe sum of API usage, split into cached and uncached prompt tokens."""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage: Any):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.cached_prompt_tokens += getattr(details, "cached_tokens", 0) or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    def __str__(self) -> str:
+        uncached = self.prompt_tokens - self.cached_prompt_tokens
+        return (
+            f"{self.requests} requests, prompt {self.prompt_tokens} "
+            f"(cached {self.cached_prompt_tokens}, uncached {uncached}), completion {self.completion_tokens}"
+        )
+
+
+# ------------ Backends ------------
+class LLMBackend:
+    """Minimal interface: one chat completion in, the provider's response object out."""
+
+    def chat(self, **kwargs) -> Any:
+        raise NotImplementedError
+
+    def is_overload(self, exc: Exception) -> bool:
+        """429 / timeout: back off and shrink concurrency."""
+        return False
+
+    def is_retryable(self, exc: Exception) -> bool:
+        return self.is_overload(exc)
+
+    def retry_after(self, exc: Exception) -> Optional[float]:
+        return None
+
+
+class OpenAIBackend(LLMBackend):
+    def __init__(self, base_url: Optional[str] = None):
+        import openai
+        self._openai = openai
+        # max_retries=0: retries and backoff are ours, so they feed the rate limiter and AIMD
+        self.client = openai.OpenAI(
+            base_url=base_url or os.getenv("LLM_BASE_URL") or None,
+            timeout=TIMEOUT,
+            max_retries=0,
+        )
+
+    def chat(self, **kwargs) -> Any:
+        return self.client.chat.completions.create(**kwargs)
+
+    def is_overload(self, exc: Exception) -> bool:
+        return isinstance(exc, (self._openai.RateLimitError, self._openai.APITimeoutError))
+
+    def is_retryable(self, exc: Exception) -> bool:
+        return self.is_overload(exc) or isinstance(
+            exc, (self._openai.APIConnectionError, self._openai.InternalServerError)
+        )
+
+    def retry_after(self, exc: Exception) -> Optional[float]:
+        response = getattr(exc, "response", None)
+        value = response.headers.get("retry-after") if response is not None else None
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+
+_BACKENDS: Dict[str, Type[LLMBackend]] = {"openai": OpenAIBackend}
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+_requests = TokenBucket(RPM)
+_tokens = TokenBucket(TPM)
+_limiter = AdaptiveLimiter(MAX_CONCURRENCY)
+
+stats: Dict[str, int] = {"requests": 0, "retries": 0, "overloads": 0}
+usage = UsageTally()  # process-wide totals
+_stats_lock = threading.Lock()
+
+
+def register_backend(name: str, cls: Type[LLMBackend]):
+    _BACKENDS[name] = cls
+
+
+def get_backend() -> LLMBackend:
+    """The process-wide backend (created once, so its connection pool is reused)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.getenv("LLM_BACKEND", "openai")
+            if name not in _BACKENDS:
+                raise RuntimeError(f"Unknown LLM_BACKEND: {name} (known: {', '.join(_BACKENDS)})")
+            _backend = _BACKENDS[name]()
+        return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]):
+    """Swap the process-wide backend (None = recreate from LLM_BACKEND on next use)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def _estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(len(m.get("content") or "") for m in messages) // 4 + COMPLETION_TOKENS_ESTIMATE
+
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        stats[key] += n
+
+
+def chat_completion(**kwargs) -> Any:
+    """
+    One chat completion through the shared backend, rate limiter and adaptive concurrency.
+    Accepts the same keyword arguments as client.chat.completions.create.
+    """
+    backend = get_backend()
+    estimate = _estimate_tokens(kwargs.get("messages", []))
+    with tracing.span("llm.chat", model=kwargs.get("model")) as sp:
+        for attempt in range(MAX_RETRIES + 1):
+            _requests.acquire(1)
+            _tokens.acquire(estimate)
+            ticket = _limiter.acquire()
+            try:
+                resp = backend.chat(**kwargs)
+            except Exception as e:
+                _limiter.release()
+                _tokens.refund(estimate)
+                if not backend.is_retryable(e) or attempt == MAX_RETRIES:
+                    raise
+                if backend.is_overload(e):
+                    _limiter.on_overload(ticket)
+                    _count("overloads")
+                    sp.add("overloads")
+                _count("retries")
+                sp.add("retries")
+                time.sleep(backend.retry_after(e) or min(60.0, 2 ** attempt) * (0.5 + random.random()))
+                continue
+            _limiter.release()
+
+            _limiter.on_success()
+            _count("requests")
+            resp_usage = getattr(resp, "usage", None)
+            if resp_usage is not None:
+                usage.add(resp_usage)
+                _tokens.refund(estimate - (resp_usage.total_tokens or 0))
+                details = getattr(resp_usage, "prompt_tokens_details", None)
+                sp.set(
+                    prompt_tokens=resp_usage.prompt_tokens or 0,
+                    cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+                    completion_tokens=resp_usage.completion_tokens or 0,
+                )
+            return resp
@@ -1,61 +1,357 @@
 # main.py
+"""
+Daily digest, as one run or stage by stage:
+
+    python main.py              # everything: summarize -> calendar -> render -> send
+    python main.py fetch        # list the papers the next run would summarize (arXiv only, nothing written)
+    python main.py summarize    # fetch + summarize into today's digest (YYYY/MM/DD.jsonl / .md)
+    python main.py calendar     # sync today's calendars and print them
+    python main.py render       # build each subscriber's email into <cache>/outbox/<day>/ (no network)
+    python main.py send         # send the emails in the outbox (e.g. again after a Gmail error)
+    python main.py serve        # long-running: poll + summarize during the day, render + send at SERVE_SEND_AT
+
+Options: --day YYYY-MM-DD (render/send a past day), --only NAME (subscribers to render/send, repeatable).
+
+Each stage imports only the libraries it uses (arxiv, openai + pypdf + tqdm, google, markdown + jinja2),
+so e.g. `render` neither loads the Google/PDF stacks nor needs any credential. Import times are
+printed at the end and recorded as "import" spans in the run log.
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import importlib
+import json
 import os
-from datetime import datetime
+import re
+import shutil
+import signal
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+import tracing
+from subscribers import Subscriber, load_subscribers, union_keywords
+from utils import arxiv_id_from_url, cache_path
 
-from arxiv_bot import run_daily_digest
-from openai_bot import summarize_pdf, summary_to_markdown
-from calendar_bot import fetch_todays_events, events_to_markdown, events_to_html
-from email_bot import send_email
-from markdown import markdown
-from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
+_STARTUP_MS = (time.perf_counter() - _STARTED) * 1000  # main.py's own imports
 
 # ----------- Topics & Keywords -----------
+# Default subscriber (EMAIL_TO); several subscribers are configured in subscribers.json, see subscribers.py
 KEYWORDS = dict()
 # KEYWORDS["3D reconstruction"] = ["neural rendering", "Gaussian Splatting", "avatar", "video understanding"]
 KEYWORDS["3D reconstruction"] = ["avatar", "video understanding"]
 KEYWORDS["deep learning"] = ["model collapse"]
 
 MAX_RESULTS = 3
+MAX_WORKERS = int(os.getenv("DIGEST_MAX_WORKERS", "4"))  # papers summarized in parallel (1 = sequential)
+BATCH_QUERIES = os.getenv("ARXIV_BATCH_QUERIES", "1") == "1"  # OR keywords into few arXiv queries
+INCREMENTAL = os.getenv("ARXIV_INCREMENTAL", "1") == "1"  # only fetch papers newer than the last run's
+ARXIV_SOURCE = os.getenv("ARXIV_SOURCE", "api")  # "mirror": match keywords against a local metadata mirror
+OUTBOX_KEEP_DAYS = 7  # rendered emails kept in <cache>/outbox for `send` / re-sends
 
-def main():
-    # 1) ----------- generate daily arXiv digest -----------
-    arXiv_md = run_daily_digest(
-        keywords_by_topic=KEYWORDS,
+_import_ms: Dict[str, float] = {}
+
+
+def _load(module: str):
+    """Import a stage's dependency on first use (timed, so the startup report shows what it cost)."""
+    if module in sys.modules:
+        return sys.modules[module]
+    t0 = time.perf_counter()
+    with tracing.span("import", module=module):
+        mod = importlib.import_module(module)
+    _import_ms[module] = (time.perf_counter() - t0) * 1000
+    return mod
+
+
+# ------------ Stages ------------
+def fetch(args, subscribers: List[Subscriber]):
+    arxiv_bot = _load("arxiv_bot")
+    state_store = _load("state_store")
+    keywords = [kw for kws in union_keywords(subscribers).values() for kw in kws]
+    listings = arxiv_bot.list_new_papers(keywords, MAX_RESULTS, BATCH_QUERIES, INCREMENTAL, ARXIV_SOURCE)
+    seen = state_store.SeenIndex()
+    try:
+        seen.sync_archive(".")
+        for kw in keywords:
+            print(f"## {kw} ({len(listings[kw])} listed)")
+            for r in listings[kw]:
+                done = arxiv_id_from_url(r.entry_id) in seen
+                print(f"- {'[done] ' if done else ''}{r.title.strip()} ({r.entry_id})")
+    finally:
+        seen.close()
+
+
+def summarize(args, subscribers: List[Subscriber]) -> str:
+    # One digest over every subscriber's keywords: each paper is fetched and summarized once,
+    # whoever follows it
+    arxiv_bot = _load("arxiv_bot")
+    openai_bot = _load("openai_bot")
+    return arxiv_bot.run_daily_digest(
+        keywords_by_topic=union_keywords(subscribers),
         max_results_per_query=MAX_RESULTS,
-        summarize_pdf_fn=summarize_pdf,
-        summary_to_markdown_fn=summary_to_markdown,
+        summarize_pdf_fn=openai_bot.summarize_pdf,
+        summary_to_markdown_fn=openai_bot.summary_to_markdown,
+        max_workers=MAX_WORKERS,
+        batch_queries=BATCH_QUERIES,
+        incremental=INCREMENTAL,
+        source=ARXIV_SOURCE,
     )
-    arXiv_html = markdown(Path(arXiv_md).read_text(encoding="utf-8"),
-                      output_format="html5",
-                      extensions=["extra","sane_lists","nl2br","tables","fenced_code","toc","md_in_html"])
 
-    # 2) ----------- generate daily Calendar digest -----------
-    events = fetch_todays_events()
-    cal_html = events_to_html(events)
 
-    # 3) ----------- write email -----------
-    today = datetime.now().strftime("%Y-%m-%d")
-    subject_prefix = os.getenv("EMAIL_SUBJECT_PREFIX", "[Daily Digest]")
-    subject = f"{subject_prefix} {today}"
+def _calendar_ids(subscribers: List[Subscriber]) -> Dict[str, List[str]]:
+    calendar_bot = _load("calendar_bot")
+    default_ids = calendar_bot.configured_calendar_ids()
+    return {sub.name: default_ids if sub.calendar_ids is None else sub.calendar_ids for sub in subscribers}
 
-    env = Environment(loader=FileSystemLoader("."))
+
+def calendar(args, subscribers: List[Subscriber], offline: bool = False) -> Dict[str, List[Dict]]:
+    # every calendar once, however many subscribers share it
+    calendar_bot = _load("calendar_bot")
+    ids = [cid for cids in _calendar_ids(subscribers).values() for cid in cids]
+    events_by_calendar = calendar_bot.fetch_events_by_calendar(ids, offline=offline, day=args.day)
+    if args.stage == "calendar":
+        print(calendar_bot.events_to_markdown(calendar_bot.merge_events(list(events_by_calendar.values()))))
+    return events_by_calendar
+
+
+def _outbox_path(day: str, sub: Subscriber) -> str:
+    return cache_path("outbox", day, re.sub(r"[^\w.@-]", "_", sub.name) + ".json")
+
+
+def _prune_outbox():
+    root = os.path.dirname(cache_path("outbox", "x"))
+    cutoff = str(date.fromordinal(date.today().toordinal() - OUTBOX_KEEP_DAYS))
+    for name in os.listdir(root):
+        if name < cutoff:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def render(args, subscribers: List[Subscriber], events_by_calendar: Dict[str, List[Dict]] | None = None):
+    digest_store = _load("digest_store")
+    openai_bot = _load("openai_bot")  # summary_to_markdown
+    calendar_bot = _load("calendar_bot")
+    renderer = _load("render")
+    compact = _load("compact")
+    jinja2 = _load("jinja2")
+
+    day = args.day or date.today()
+    md_path = digest_store.day_md_path(day)
+    if not os.path.exists(md_path):
+        raise RuntimeError(f"No digest for {day} ({md_path}); run `python main.py summarize` first.")
+    store = digest_store.store_path(md_path)
+    records = digest_store.load(store) if os.path.exists(store) else None
+    if events_by_calendar is None:
+        # a standalone render uses the calendar cache as of the last sync
+        events_by_calendar = calendar(args, subscribers, offline=True)
+    calendar_ids = _calendar_ids(subscribers)
+
+    subject_prefix = os.getenv("EMAIL_SUBJECT_PREFIX", "[Daily Digest]")
+    subject = f"{subject_prefix} {day}"
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader("."))
     template = env.get_template("template.html")
 
-    combined_html = template.render(
-        title=f"Daily Digest {today}",
-        arXiv_html=arXiv_html,
-        cal_html=cal_html
-    )
+    for sub in subscribers:
+        with tracing.span("markdown.render", path=md_path, subscriber=sub.name):
+            # markdown comes from the day's structured store, filtered to the subscriber's keywords;
+            # blocks shared with other subscribers (or earlier runs) come from the fragment cache
+            if records is not None:
+                md = digest_store.render_markdown(
+                    digest_store.select_records(records, sub.keywords), openai_bot.summary_to_markdown)
+            else:  # a day that predates the store: everyone gets the whole digest
+                md = digest_store.load_day_markdown(md_path, openai_bot.summary_to_markdown)
+            fragments = renderer.render_fragments(md)
+
+        events = calendar_bot.merge_events([events_by_calendar[cid] for cid in calendar_ids[sub.name]])
+        cal_html = calendar_bot.events_to_html(events)
+
+        def render_page(arXiv_html: str) -> str:
+            return template.render(
+                title=f"Daily Digest {day}",
+                arXiv_html=arXiv_html,
+                cal_html=cal_html
+            )
+
+        # minify (inline styles stay inline) and stay below Gmail's clipping size
+        with tracing.span("email.compact", subscriber=sub.name) as sp:
+            combined_html, report = compact.fit_budget(fragments, render_page)
+            sp.set(**report)
+        print(f"[email] {sub.name}: html {report['raw_bytes']:,} -> {report['bytes']:,} bytes "
+              f"(budget {report['budget']:,}; {report['collapsed']}/{report['papers']} papers collapsed to titles)")
+
+        with open(_outbox_path(str(day), sub), "w", encoding="utf-8") as f:
+            json.dump({"to": sub.email, "subject": subject, "html": combined_html}, f, ensure_ascii=False)
+    _prune_outbox()
 
+
+def send(args, subscribers: List[Subscriber]):
+    email_bot = _load("email_bot")
+    day = str(args.day or date.today())
+    failed = []
+    for sub in subscribers:
+        path = _outbox_path(day, sub)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                mail = json.load(f)
+            email_bot.send_email(
+                subject=mail["subject"],
+                body_markdown="This message is best viewed in HTML.",
+                html_body=mail["html"],
+                to=mail["to"],
+            )
+            mail["sent_at"] = datetime.now().isoformat(timespec="seconds")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(mail, f, ensure_ascii=False)
+        except Exception as e:
+            # one bad address (or a missing render) must not cost everyone else their digest
+            print(f"[email] {sub.name}: send failed: {e}")
+            failed.append(sub.name)
+            continue
+        print(f"[OK] Email sent to {sub.name}.")
+    if failed:
+        raise RuntimeError(f"Email not sent to: {', '.join(failed)}")
+
+
+def run(args, subscribers: List[Subscriber]):
+    # 1) ----------- generate daily arXiv digest -----------
+    summarize(args, subscribers)
+    # 2) ----------- generate daily Calendar digest -----------
+    events_by_calendar = calendar(args, subscribers)
+    # 3) ----------- write email -----------
+    render(args, subscribers, events_by_calendar)
     # 4) ----------- send email -----------
-    send_email(
-        subject=subject,
-        body_markdown="This message is best viewed in HTML.",  
-        html_body=combined_html,                                
-    )
-    
-    print("[OK] Email sent.")
+    send(args, subscribers)
+
+
+# ------------ Service mode ------------
+SERVE_POLL_MINUTES = float(os.getenv("SERVE_POLL_MINUTES", "30"))  # arXiv poll interval
+SERVE_SEND_AT = os.getenv("SERVE_SEND_AT", "07:30")  # local time of the daily email
+
+
+def _sent(day: date, sub: Subscriber) -> bool:
+    try:
+        with open(_outbox_path(str(day), sub), "r", encoding="utf-8") as f:
+            return bool(json.load(f).get("sent_at"))
+    except (OSError, ValueError):
+        return False
+
+
+def _deliver(args, subscribers: List[Subscriber]):
+    """The send-time step of serve: only what the polls have not done yet, i.e. calendars, render and send."""
+    digest_store = _load("digest_store")
+    if not os.path.exists(digest_store.day_md_path(date.today())):
+        summarize(args, subscribers)  # started after send time: nothing polled yet today
+    events_by_calendar = calendar(args, subscribers)
+    render(args, subscribers, events_by_calendar)
+    send(args, subscribers)
+
+
+def _poll(args, subscribers: List[Subscriber]):
+    """A poll step of serve: summarize whatever was submitted since the previous poll."""
+    digest_store = _load("digest_store")
+    store = digest_store.store_path(digest_store.day_md_path(date.today()))
+
+    def _papers() -> int:
+        return sum(r["type"] == "paper" for r in digest_store.load(store)) if os.path.exists(store) else 0
+
+    before, t0 = _papers(), time.perf_counter()
+    summarize(args, subscribers)
+    print(f"[serve] poll: {_papers() - before} new papers in {time.perf_counter() - t0:.1f}s")
+
+
+def serve(args, subscribers: List[Subscriber], stop: threading.Event | None = None):
+    """
+    Long-running service mode (python main.py serve), instead of one cold cron run a day.
+
+    Every SERVE_POLL_MINUTES it runs the digest, which with the high-water marks only fetches and
+    summarizes papers submitted since the previous poll, so the LLM work is spread over the day.
+    At SERVE_SEND_AT the calendars are synced and the day's digest, already summarized, is rendered
+    and sent. Then it idles until midnight: papers announced meanwhile are the next day's first
+    poll (the marks make sure none is skipped). The arXiv client, the LLM backend and the Google
+    credentials/services are module-level and stay warm between steps. A failed step is logged and
+    retried at the next poll; emails already sent (sent_at in the outbox) are not sent again.
+    """
+    stop = stop or threading.Event()
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())  # finish the current step, then exit
+    except ValueError:
+        pass  # not the main thread: the caller owns `stop`
+    for module in ("arxiv_bot", "openai_bot", "calendar_bot", "email_bot", "render", "compact", "jinja2"):
+        _load(module)
+
+    hour, minute = (int(x) for x in SERVE_SEND_AT.split(":"))
+    poll = timedelta(minutes=SERVE_POLL_MINUTES)
+    print(f"[serve] polling arXiv every {SERVE_POLL_MINUTES:g} min, sending at {SERVE_SEND_AT}")
+    while not stop.is_set():
+        now = datetime.now()
+        today = now.date()
+        send_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        pending = [sub for sub in subscribers if not _sent(today, sub)]
+        if not pending:
+            step, wake = None, datetime.combine(today + timedelta(days=1), datetime.min.time())
+        elif now >= send_at:
+            step, wake = ("deliver", _deliver, pending), now + poll
+        else:
+            step, wake = ("poll", _poll, subscribers), min(now + poll, send_at)
+        if step:
+            name, fn, subs = step
+            try:
+                _traced(f"serve.{name}", fn, args, subs, report=name != "poll")
+            except Exception as e:
+                print(f"[serve] {name} failed, retrying at the next poll: {e!r}")
+            else:
+                if name == "deliver":
+                    continue  # all sent: plan the next day
+        print(f"[serve] next step at {wake:%Y-%m-%d %H:%M:%S}")
+        stop.wait(max(0.0, (wake - datetime.now()).total_seconds()))
+
+
+STAGES = {"run": run, "fetch": fetch, "summarize": summarize, "calendar": calendar, "render": render, "send": send,
+          "serve": serve}
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Daily arXiv + calendar digest")
+    ap.add_argument("stage", nargs="?", default="run", choices=list(STAGES))
+    ap.add_argument("--day", type=date.fromisoformat, help="YYYY-MM-DD to render/send (default today)")
+    ap.add_argument("--only", action="append", default=[], metavar="NAME", help="only these subscribers")
+    return ap.parse_args(argv)
+
+
+def _traced(stage: str, fn, args, subscribers: List[Subscriber], report: bool = True):
+    tracing.start_run(stage=stage, keywords=sum(len(v) for v in union_keywords(subscribers).values()),
+                      max_results=MAX_RESULTS, subscribers=len(subscribers))
+    try:
+        with tracing.span("run", stage=stage):
+            return fn(args, subscribers)
+    finally:
+        table = tracing.end_run()
+        if report:
+            print(f"[trace] where the time went (run log: {tracing.log_path or 'disabled'})\n{table}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.day and args.stage not in ("render", "send", "calendar"):
+        raise SystemExit(f"--day only applies to render, send and calendar, not {args.stage}")
+    subscribers = load_subscribers(KEYWORDS)
+    if args.only:
+        subscribers = [s for s in subscribers if s.name in args.only]
+        if not subscribers:
+            raise SystemExit(f"No subscriber named {', '.join(args.only)}")
+
+    try:
+        if args.stage == "serve":
+            serve(args, subscribers)  # one trace run per step
+        else:
+            _traced(args.stage, STAGES[args.stage], args, subscribers)
+    finally:
+        imports = ", ".join(f"{m} {ms:.0f} ms" for m, ms in _import_ms.items()) or "none"
+        print(f"[startup] main.py imports {_STARTUP_MS:.0f} ms; stage imports: {imports} "
+              f"(total {sum(_import_ms.values()):.0f} ms)")
 
 
 if __name__ == "__main__":
@@ -3,20 +3,42 @@ import os
 import re
 import json
 import math
-import tempfile
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Any
-from urllib.parse import urlparse
-from urllib.request import urlopen, Request
 
-from tqdm import tqdm
-from pypdf import PdfReader
-from openai import OpenAI
+import llm_backend
+import journal
+import summary_cache
+import tracing
+from pdf_tools import EXTRACT_MAX_PAGES, iter_page_texts, open_pdf
+from utils import arxiv_id_from_url, split_arxiv_version
 
 # ------------ Config ------------
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # change to a model you have access to
 CHUNK_CHAR_LEN = 8000
 OVERLAP = 500
-TIMEOUT = 90
+CHUNK_CONCURRENCY = int(os.getenv("OPENAI_CHUNK_CONCURRENCY", "4"))  # chunks of one paper summarized in parallel
+CHUNKER = os.getenv("OPENAI_CHUNKER", "section")  # "section" (token-budgeted sections) or "fixed" (CHUNK_CHAR_LEN windows)
+CHUNK_MAX_TOKENS = int(os.getenv("OPENAI_CHUNK_MAX_TOKENS", "16000"))  # cap per chunk, even with a huge context window
+PROMPT_RESERVE_TOKENS = 4000  # system prompt + schema + JSON answer
+CHUNK_TOP_K = int(os.getenv("OPENAI_CHUNK_TOP_K", "6"))  # most relevant chunks sent per paper (0 = all)
+EARLY_STOP = os.getenv("OPENAI_EARLY_STOP", "1") == "1"  # stop sending chunks once required fields are filled
+
+# Context window (tokens) by model prefix; the longest matching prefix wins
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-5": 400000,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+}
+DEFAULT_CONTEXT_TOKENS = 16385
 
 SYSTEM_INSTRUCTIONS = (
     "You are a meticulous academic reading assistant. "
@@ -95,25 +117,52 @@ JSON_SCHEMA: Dict[str, Any] = {
     "additionalProperties": False
 }
 
+# Shape shown to the model in every chunk request
+SCHEMA_HINT: Dict[str, Any] = {
+    "paper_title": "string",
+    "task": "string",
+    "motivation_and_gaps": {
+        "overview": "string",
+        "related_work_challenges": [{"work": "string", "challenge": "string"}]
+    },
+    "core_idea": "string",
+    "method": {
+        "pipeline": "string",
+        "architecture_loss_training": "string",
+        "complexity_resources": "string"
+    },
+    "experiments": {
+        "datasets_and_metrics": "string",
+        "baselines": ["string"],
+        "main_results": "string",
+        "ablations": "string",
+        "limitations_tests": "string"
+    },
+    "takeaways": {
+        "pros_3": ["string","string","string"],
+        "cons_3": ["string","string","string"],
+        "future_3": ["string","string","string"]
+    },
+    "resources": {
+        "code_links": ["string"],
+        "model_or_data_links": ["string"]
+    }
+}
 
-# ------------ Helpers ------------
-def _download_if_url(path_or_url: str) -> str:
-    parsed = urlparse(path_or_url)
-    if parsed.scheme in ("http", "https"):
-        req = Request(path_or_url, headers={"User-Agent": "Mozilla/5.0"})
-        with urlopen(req, timeout=TIMEOUT) as resp, tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(resp.read())
-            return tmp.name
-    return path_or_url
+CHUNK_SYSTEM_PROMPT = (
+    "You are a meticulous academic assistant. "
+    "Always output a valid single JSON object with all keys. "
+    "If a field is missing in the text, fill it with 'N/A'."
+)
 
 
+# ------------ Helpers ------------
 def extract_text(pdf_path: str) -> str:
-    reader = PdfReader(pdf_path)
-    txts = []
-    for page in reader.pages:
-        txt = page.extract_text() or ""
-        txts.append(txt)
-    return "\n".join(txts)
+    with tracing.span("pdf.extract", path=os.path.basename(pdf_path)) as sp:
+        pages = list(iter_page_texts(pdf_path))
+        text = "\n".join(pages)
+        sp.set(pages=len(pages), chars=len(text))
+    return text
 
 
 def chunk_text(text: str, chunk_size: int = CHUNK_CHAR_LEN, overlap: int = OVERLAP) -> List[str]:
@@ -129,72 +178,322 @@ def chunk_text(text: str, chunk_size: int = CHUNK_CHAR_LEN, overlap: int = OVERL
     return chunks
 
 
-def _client() -> OpenAI:
-    return OpenAI()
+# ------------ Section-aware chunking ------------
+# "3 Method", "2.1 Related Work", "IV. EXPERIMENTS", "Appendix B Proofs", "References", ...
+_NAMED_HEADINGS = (
+    r"abstract|introduction|related work|background|preliminaries|method(?:s|ology)?|approach|"
+    r"experiments?|experimental (?:setup|results)|evaluation|results|discussion|limitations|"
+    r"conclusions?(?: and future work)?|future work|acknowledge?ments?|references|bibliography|appendix"
+)
+_HEADING_RE = re.compile(
+    r"^(?:"
+    r"(?:\d{1,2}(?:\.\d{1,2}){0,2}\.?|[IVX]{1,5}\.)\s+[A-Z][^\n]{0,78}"  # numbered heading
+    r"|(?:appendix\s+[A-Z](?:[\s.:][^\n]{0,70})?)"  # Appendix A ...
+    r"|(?:\d{1,2}\.?\s+)?(?:" + _NAMED_HEADINGS + r")\.?"  # bare well-known heading
+    r")$",
+    re.IGNORECASE,
+)
 
 
-# ------------ OpenAI calls ------------
-def summarize_chunk(chunk: str) -> dict:
+def _is_heading(line: str) -> bool:
+    line = line.strip()
+    if not line or len(line) > 80 or len(line.split()) > 10:
+        return False
+    if line.endswith((",", ";")) or (line.endswith(".") and len(line.split()) > 3):
+        return False
+    return bool(_HEADING_RE.match(line))
+
+
+def model_context_tokens(model: str) -> int:
+    best = ""
+    for prefix in MODEL_CONTEXT_TOKENS:
+        if model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return MODEL_CONTEXT_TOKENS[best] if best else DEFAULT_CONTEXT_TOKENS
+
+
+def chunk_token_budget(model: str) -> int:
+    return max(1000, min(CHUNK_MAX_TOKENS, model_context_tokens(model) - PROMPT_RESERVE_TOKENS))
+
+
+@lru_cache(maxsize=8)
+def _encoder(model: str):
+    try:
+        import tiktoken
+    except ImportError:  # optional: token counts fall back to a ~4 chars/token estimate
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:  # e.g. BPE files can't be downloaded
+            return None
+
+
+def count_tokens(text: str, model: str = MODEL) -> int:
+    enc = _encoder(model)
+    if enc is None:
+        return math.ceil(len(text) / 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def split_sections(text: str) -> List[str]:
+    """Split extracted paper text at section headings; each section keeps its heading line."""
+    sections: List[str] = []
+    current: List[str] = []
+    for line in text.split("\n"):
+        if _is_heading(line) and any(l.strip() for l in current):
+            sections.append("\n".join(current).strip("\n"))
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        sections.append("\n".join(current).strip("\n"))
+    return sections
+
+
+def _split_oversized(section: str, budget: int, model: str) -> List[str]:
+    """Break a section that alone exceeds the budget at paragraph, then sentence, then character level."""
+    for pattern in (r"\n\s*\n", r"(?<=[.!?])\s+"):
+        pieces = [p for p in re.split(pattern, section) if p.strip()]
+        if len(pieces) > 1:
+            sep = "\n\n" if pattern.startswith(r"\n") else " "
+            return _pack(pieces, budget, model, sep)
+    step = max(1, budget * 4)
+    return [section[i:i + step] for i in range(0, len(section), step)]
+
+
+def _pack(pieces: List[str], budget: int, model: str, sep: str = "\n\n") -> List[str]:
+    """Greedily pack whole pieces into chunks of at most `budget` tokens."""
+    chunks: List[str] = []
+    buf: List[str] = []
+    used = 0
+    for piece in pieces:
+        n = count_tokens(piece, model)
+        if n > budget:
+            if buf:
+                chunks.append(sep.join(buf))
+                buf, used = [], 0
+            chunks.extend(_split_oversized(piece, budget, model))
+            continue
+        if buf and used + n > budget:
+            chunks.append(sep.join(buf))
+            buf, used = [], 0
+        buf.append(piece)
+        used += n
+    if buf:
+        chunks.append(sep.join(buf))
+    return chunks
+
+
+def chunk_sections(text: str, model: str = MODEL, budget: int | None = None) -> List[str]:
     """
-    Summarize one chunk of paper text into a structured JSON dict.
-    Robust against non-JSON responses.
+    Pack whole paper sections into as few chunks as the model's context allows.
+    Unlike chunk_text there is no overlap: sections are never cut unless one alone exceeds the budget.
     """
-    import json as _json
-    cli = _client()
-    schema_hint = {
-        "paper_title": "string",
-        "task": "string",
-        "motivation_and_gaps": {
-            "overview": "string",
-            "related_work_challenges": [{"work": "string", "challenge": "string"}]
-        },
-        "core_idea": "string",
-        "method": {
-            "pipeline": "string",
-            "architecture_loss_training": "string",
-            "complexity_resources": "string"
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    budget = budget or chunk_token_budget(model)
+    # Reference lists get chunks of their own, so prune_chunks can drop them without losing body text
+    chunks: List[str] = []
+    body: List[str] = []
+    for section in split_sections(text):
+        if _REFERENCES_HEADING_RE.match(section):
+            chunks += _pack(body, budget, model) + _pack([section], budget, model)
+            body = []
+        else:
+            body.append(section)
+    return chunks + _pack(body, budget, model)
+
+
+def make_chunks(text: str, model: str = MODEL) -> List[str]:
+    """Chunk with the configured OPENAI_CHUNKER and report the saving over the fixed-window splitter."""
+    if CHUNKER == "fixed":
+        return chunk_text(text, CHUNK_CHAR_LEN, OVERLAP)
+    chunks = chunk_sections(text, model)
+    fixed = chunk_text(text, CHUNK_CHAR_LEN, OVERLAP)
+    # every request also re-sends the system prompt and schema
+    overhead = count_tokens(_static_prefix(), model)
+    new_tokens = sum(count_tokens(c, model) for c in chunks) + overhead * len(chunks)
+    old_tokens = sum(count_tokens(c, model) for c in fixed) + overhead * len(fixed)
+    print(
+        f"[chunker] sections: {len(chunks)} chunks / {new_tokens} prompt tokens, "
+        f"fixed: {len(fixed)} chunks / {old_tokens} prompt tokens "
+        f"(saved {len(fixed) - len(chunks)} requests, {old_tokens - new_tokens} tokens)"
+    )
+    return chunks
+
+
+# ------------ Relevance pruning ------------
+# What each JSON_SCHEMA field is looking for; chunks are ranked against these with BM25
+FIELD_QUERIES: Dict[str, str] = {
+    "task": "task problem goal objective we address we study we tackle setting formulation input output",
+    "motivation_and_gaps": "motivation challenge limitation existing prior previous work however fail gap "
+                           "suffer lack costly difficult remains unsolved",
+    "core_idea": "we propose we introduce key idea insight novel contribution our approach framework",
+    "method": "method architecture pipeline module network encoder decoder loss objective training "
+              "optimization algorithm parameters complexity memory gpu",
+    "experiments": "experiments dataset benchmark metric evaluation baseline results outperform ablation "
+                   "table accuracy comparison state-of-the-art",
+}
+
+_REFERENCES_HEADING_RE = re.compile(
+    r"^\s*(?:\d{1,2}\.?\s+)?(?:references|bibliography|acknowledge?ments?)\.?\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_CITATION_LINE_RE = re.compile(
+    r"^\s*\[\d{1,3}\]|et al\.|arXiv preprint|arXiv:\d{4}\.\d{4,5}|In Proceedings|"
+    r"\b(?:CVPR|ICCV|ECCV|NeurIPS|ICLR|ICML|AAAI|TPAMI)\b.*\b(?:19|20)\d{2}\b",
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r"[a-z][a-z\-]+")
+
+
+def is_reference_chunk(chunk: str) -> bool:
+    """A chunk that starts with a References/Acknowledgements heading, or is mostly citation lines."""
+    lines = [l for l in chunk.split("\n") if l.strip()]
+    if not lines:
+        return True
+    if _REFERENCES_HEADING_RE.match(lines[0]):
+        return True
+    cites = sum(1 for l in lines if _CITATION_LINE_RE.search(l))
+    return cites / len(lines) > 0.5
+
+
+def _bm25_scores(query: List[str], docs: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    n = len(docs)
+    avgdl = sum(len(d) for d in docs) / n or 1.0
+    df: Dict[str, int] = {}
+    for d in docs:
+        for term in set(d):
+            df[term] = df.get(term, 0) + 1
+    tfs = []
+    for d in docs:
+        tf: Dict[str, int] = {}
+        for term in d:
+            tf[term] = tf.get(term, 0) + 1
+        tfs.append(tf)
+    scores = []
+    for d, tf in zip(docs, tfs):
+        score = 0.0
+        for term in query:
+            if term not in tf:
+                continue
+            idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+            f = tf[term]
+            score += idf * f * (k1 + 1) / (f + k1 * (1 - b + b * len(d) / avgdl))
+        scores.append(score)
+    return scores
+
+
+def prune_chunks(chunks: List[str], top_k: int = CHUNK_TOP_K) -> List[str]:
+    """
+    Drop reference-list chunks, then keep the top_k chunks most relevant to the schema fields.
+    Fields take turns picking their best remaining chunk, the first chunk (title/abstract) is always
+    kept, and the result stays in document order so merge_partials behaves as before.
+    """
+    kept = [i for i, c in enumerate(chunks) if not is_reference_chunk(c)] or list(range(len(chunks)))
+    dropped_refs = len(chunks) - len(kept)
+    if top_k <= 0 or len(kept) <= top_k:
+        selected = kept
+    else:
+        docs = [_WORD_RE.findall(chunks[i].lower()) for i in kept]
+        rankings = []
+        for query in FIELD_QUERIES.values():
+            scores = _bm25_scores(_WORD_RE.findall(query), docs)
+            rankings.append(sorted(range(len(kept)), key=lambda j: -scores[j]))
+        picked = {0}
+        rank = 0
+        while len(picked) < top_k and rank < len(kept):
+            for order in rankings:
+                if len(picked) >= top_k:
+                    break
+                picked.add(order[rank])
+            rank += 1
+        selected = [kept[j] for j in sorted(picked)]
+    if len(selected) < len(chunks):
+        print(f"[prune] kept {len(selected)}/{len(chunks)} chunks ({dropped_refs} reference chunks dropped)")
+    return [chunks[i] for i in selected]
+
+
+def prompt_fingerprint() -> str:
+    """Hash of everything that shapes a summary besides the paper itself and the model."""
+    blob = json.dumps(
+        {
+            "prefix": _static_prefix(),
+            "user_template": build_chunk_messages("")[-1]["content"],
+            "request": CHUNK_REQUEST,
+            "schema": JSON_SCHEMA,
+            "chunking": [CHUNKER, CHUNK_CHAR_LEN, OVERLAP, CHUNK_MAX_TOKENS, CHUNK_TOP_K, EARLY_STOP],
+            "field_queries": FIELD_QUERIES,
+            "max_pages": EXTRACT_MAX_PAGES,
         },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+# ------------ OpenAI calls ------------
+# Fixed request parameters; only the model and the last message change between calls
+CHUNK_REQUEST: Dict[str, Any] = {"temperature": 0, "response_format": {"type": "json_object"}}
+
+
+@lru_cache(maxsize=1)
+def _static_prefix() -> str:
+    """
+    System instructions + schema, serialized once per process. Every request starts with these exact
+    bytes and the chunk text comes last, so the provider can serve the prefix from its prompt cache.
+    """
+    return (
+        f"{CHUNK_SYSTEM_PROMPT}\n\n"
+        f"Return JSON exactly in this shape:\n"
+        f"{json.dumps(SCHEMA_HINT, ensure_ascii=False)}"
+    )
+
+
+def build_chunk_messages(chunk: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": _static_prefix()},
+        {"role": "user", "content": f"Paper content chunk:\n{chunk}"},
+    ]
+
+
+def _fallback_summary() -> dict:
+    """All-"N/A" skeleton returned for an unparsable chunk response."""
+    return {
+        "paper_title": "N/A",
+        "task": "N/A",
+        "motivation_and_gaps": {"overview": "N/A", "related_work_challenges": []},
+        "core_idea": "N/A",
+        "method": {"pipeline": "N/A", "architecture_loss_training": "N/A", "complexity_resources": "N/A"},
         "experiments": {
-            "datasets_and_metrics": "string",
-            "baselines": ["string"],
-            "main_results": "string",
-            "ablations": "string",
-            "limitations_tests": "string"
+            "datasets_and_metrics": "N/A",
+            "baselines": [],
+            "main_results": "N/A",
+            "ablations": "N/A",
+            "limitations_tests": "N/A"
         },
         "takeaways": {
-            "pros_3": ["string","string","string"],
-            "cons_3": ["string","string","string"],
-            "future_3": ["string","string","string"]
+            "pros_3": ["N/A","N/A","N/A"],
+            "cons_3": ["N/A","N/A","N/A"],
+            "future_3": ["N/A","N/A","N/A"]
         },
-        "resources": {
-            "code_links": ["string"],
-            "model_or_data_links": ["string"]
-        }
+        "resources": {"code_links": [], "model_or_data_links": []}
     }
 
-    resp = cli.chat.completions.create(
+
+def summarize_chunk(chunk: str, usage: llm_backend.UsageTally | None = None) -> dict:
+    """
+    Summarize one chunk of paper text into a structured JSON dict.
+    Robust against non-JSON responses.
+    """
+    resp = llm_backend.chat_completion(
         model=os.getenv("OPENAI_MODEL", MODEL),
-        temperature=0,
-        response_format={"type": "json_object"},
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a meticulous academic assistant. "
-                    "Always output a valid single JSON object with all keys. "
-                    "If a field is missing in the text, fill it with 'N/A'."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    f"Return JSON exactly in this shape:\n"
-                    f"{_json.dumps(schema_hint, ensure_ascii=False)}\n\n"
-                    f"Paper content chunk:\n{chunk}"
-                ),
-            },
-        ],
+        messages=build_chunk_messages(chunk),
+        **CHUNK_REQUEST,
     )
+    if usage is not None:
+        usage.add(getattr(resp, "usage", None))
 
     text = resp.choices[0].message.content or ""
     text = text.strip()
@@ -211,26 +510,38 @@ def summarize_chunk(chunk: str) -> dict:
             except Exception:
                 pass
         # If still bad, return skeleton with N/A
-        return {
-            "paper_title": "N/A",
-            "task": "N/A",
-            "motivation_and_gaps": {"overview": "N/A", "related_work_challenges": []},
-            "core_idea": "N/A",
-            "method": {"pipeline": "N/A", "architecture_loss_training": "N/A", "complexity_resources": "N/A"},
-            "experiments": {
-                "datasets_and_metrics": "N/A",
-                "baselines": [],
-                "main_results": "N/A",
-                "ablations": "N/A",
-                "limitations_tests": "N/A"
-            },
-            "takeaways": {
-                "pros_3": ["N/A","N/A","N/A"],
-                "cons_3": ["N/A","N/A","N/A"],
-                "future_3": ["N/A","N/A","N/A"]
-            },
-            "resources": {"code_links": [], "model_or_data_links": []}
-        }
+        return _fallback_summary()
+
+
+def _required_paths(schema: Dict[str, Any], prefix: tuple = ()) -> List[tuple]:
+    """Leaf paths of JSON_SCHEMA's "required" keys, e.g. ("experiments", "main_results")."""
+    paths = []
+    for key in schema.get("required", []):
+        sub = schema["properties"][key]
+        if sub.get("type") == "object" and sub.get("required"):
+            paths += _required_paths(sub, prefix + (key,))
+        else:
+            paths.append(prefix + (key,))
+    return paths
+
+
+REQUIRED_FIELDS = _required_paths(JSON_SCHEMA)
+
+
+def missing_required(merged: Dict[str, Any]) -> List[str]:
+    """Required fields of JSON_SCHEMA that are still "N/A" / empty in a merge_partials result."""
+    missing = []
+    for path in REQUIRED_FIELDS:
+        v: Any = merged
+        for key in path:
+            v = v.get(key) if isinstance(v, dict) else None
+        if isinstance(v, list):
+            filled = any(x and x != "N/A" for x in v)
+        else:
+            filled = bool(v) and v != "N/A"
+        if not filled:
+            missing.append(".".join(path))
+    return missing
 
 
 def merge_partials(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -299,14 +610,87 @@ def merge_partials(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
 
 
 # ------------ Public API ------------
-def summarize_pdf(pdf_path_or_url: str) -> Dict[str, Any]:
-    local = _download_if_url(pdf_path_or_url)
-    text = extract_text(local)
-    chunks = chunk_text(text, CHUNK_CHAR_LEN, OVERLAP)
+def summarize_pdf(pdf_path_or_url: str, max_concurrency: int = CHUNK_CONCURRENCY) -> Dict[str, Any]:
+    with tracing.span("paper.summarize", url=pdf_path_or_url) as sp:
+        return _summarize_pdf(pdf_path_or_url, max_concurrency, sp)
+
+
+def _summarize_pdf(pdf_path_or_url: str, max_concurrency: int, sp: tracing.Span) -> Dict[str, Any]:
+    # Only versioned arXiv ids are cached: an unversioned link may point to a newer revision tomorrow.
+    arxiv_id = arxiv_id_from_url(pdf_path_or_url)
+    cache_key = None
+    if arxiv_id and split_arxiv_version(arxiv_id)[1] is not None:
+        cache_key = summary_cache.make_key(arxiv_id, os.getenv("OPENAI_MODEL", MODEL), prompt_fingerprint())
+        cached = summary_cache.get(cache_key)
+        if cached is not None:
+            sp.set(cache_hit=True)
+            return cached
+
+    # Checkpoints of unfinished work (same key as the summary cache): a rerun after a crash reuses
+    # the extracted text and every chunk call that had completed.
+    paper_journal = journal.open_paper(arxiv_id, cache_key) if cache_key else None
+    text = paper_journal.text() if paper_journal else None
+    resumed = text is not None
+    if text is None:
+        with open_pdf(pdf_path_or_url) as local:
+            text = extract_text(local)
+        if paper_journal:
+            paper_journal.save_text(text)
+    chunks = prune_chunks(make_chunks(text, os.getenv("OPENAI_MODEL", MODEL)))
+    done = paper_journal.partials() if paper_journal else {}
+    if resumed:
+        print(f"[journal] resuming {arxiv_id}: text + {len(done)} finished chunk calls")
     parts: List[Dict[str, Any]] = []
-    for ch in tqdm(chunks, desc="Summarizing PDF"):
-        parts.append(summarize_chunk(ch))
-    return merge_partials(parts)
+    usage = llm_backend.UsageTally()
+
+    def summarize(ch: str) -> Dict[str, Any]:
+        key = journal.chunk_key(ch)
+        if key in done:
+            return done[key]
+        part = summarize_chunk(ch, usage=usage)
+        # an unparsable response is retried on the next run, not replayed from the journal
+        if paper_journal and part != _fallback_summary():
+            paper_journal.save_partial(key, part)
+        return part
+
+    from tqdm import tqdm
+    if max_concurrency <= 1 or len(chunks) <= 1:
+        for ch in tqdm(chunks, desc="Summarizing PDF"):
+            parts.append(summarize(ch))
+            if EARLY_STOP and not missing_required(merge_partials(parts)):
+                break
+    else:
+        # map() yields in submission order, so merge_partials sees the same order as the sequential loop.
+        # With EARLY_STOP, chunks go out in waves of max_concurrency and the fill state is checked in between.
+        wave = min(max_concurrency, len(chunks)) if EARLY_STOP else len(chunks)
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks))) as pool, \
+                tqdm(total=len(chunks), desc="Summarizing PDF") as bar:
+            for start in range(0, len(chunks), wave):
+                for part in pool.map(summarize, chunks[start:start + wave]):
+                    parts.append(part)
+                    bar.update(1)
+                if EARLY_STOP and not missing_required(merge_partials(parts)):
+                    break
+    calls = len(parts)
+    if EARLY_STOP and calls > 1 and not missing_required(merge_partials(parts)):
+        # Merge only what the sequential loop would have: the shortest prefix that fills every required
+        # field (the rest of the last wave was already paid for, but must not change the summary)
+        while len(parts) > 1 and not missing_required(merge_partials(parts[:-1])):
+            parts.pop()
+    if calls < len(chunks):
+        print(f"[early-stop] required fields filled after {len(parts)}/{len(chunks)} chunks "
+              f"({calls} chunk calls, saved {len(chunks) - calls})")
+    print(f"[tokens] {usage}")
+    sp.set(chunks=len(chunks), calls=calls, prompt_tokens=usage.prompt_tokens,
+           cached_tokens=usage.cached_prompt_tokens, completion_tokens=usage.completion_tokens)
+    merged = merge_partials(parts)
+    # Don't pin an all-"N/A" result (e.g. every chunk came back unparsable) for MAX_AGE_DAYS
+    # (nor keep its journal: the next run starts the paper over)
+    if cache_key:
+        if merged["task"] != "N/A" or merged["core_idea"] != "N/A":
+            summary_cache.put(cache_key, arxiv_id, merged)
+        paper_journal.finish()
+    return merged
 
 
 def summary_to_markdown(s: dict) -> str:
@@ -0,0 +1,308 @@
+# pdf_tools.py
+"""
+PDF download & local cache.
+
+- Responses are streamed to disk in BLOCK_SIZE blocks instead of being read into memory.
+- Keep-alive HTTP(S) connections are reused per host (one pool per thread).
+- arXiv PDFs are cached under <cache>/pdfs/ by arXiv id. A versioned id (2604.09324v1) never
+  changes, so its cached copy is used without touching the network; unversioned ids are
+  revalidated with ETag / Last-Modified.
+- Other URLs go to a temporary file that is deleted once the caller is done with it.
+
+PDF text extraction:
+- Page ranges are extracted in a shared process pool and yielded lazily, in page order.
+- An optional page budget stops extraction after N pages (appendices, supplementary material).
+
+Environment variables:
+   - PDF_CACHE_MAX_MB: total size of cached PDFs before LRU eviction (default 512)
+   - PDF_CACHE_MAX_AGE_DAYS: cached PDFs unused for longer are removed (default 14)
+   - PDF_EXTRACT_WORKERS: extraction processes (default min(4, CPU count); 1 = in-process)
+   - PDF_EXTRACT_MAX_PAGES: only extract the first N pages (default 0 = all pages)
+"""
+
+import atexit
+import http.client
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import tracing
+from utils import arxiv_id_from_url, cache_path, split_arxiv_version
+
+TIMEOUT = 90
+BLOCK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+USER_AGENT = "Mozilla/5.0"
+CACHE_MAX_BYTES = int(float(os.getenv("PDF_CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_MAX_AGE_DAYS = float(os.getenv("PDF_CACHE_MAX_AGE_DAYS", "14"))
+EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_MAX_PAGES = int(os.getenv("PDF_EXTRACT_MAX_PAGES", "0"))
+PAGES_PER_TASK = 4
+
+_local = threading.local()
+_key_locks: Dict[str, threading.Lock] = {}
+_key_locks_guard = threading.Lock()
+_evict_lock = threading.Lock()  # one eviction scan at a time (each cache-miss download triggers one)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_guard = threading.Lock()
+
+
+# ------------ Connection pool ------------
+def _connection(scheme: str, netloc: str) -> http.client.HTTPConnection:
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = {}
+    conn = pool.get((scheme, netloc))
+    if conn is None:
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = pool[(scheme, netloc)] = cls(netloc, timeout=TIMEOUT)
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str):
+    conn = getattr(_local, "pool", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _request(url: str, headers: Dict[str, str]) -> Tuple[http.client.HTTPResponse, str]:
+    """
+    GET url on a pooled connection, following redirects.
+    Returns (response, final_url); the caller must read the response to the end.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        req_headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity", **headers}
+
+        # A pooled connection may have been closed by the server while idle: retry once on a fresh one.
+        for attempt in range(2):
+            conn = _connection(parsed.scheme, parsed.netloc)
+            try:
+                conn.request("GET", path, headers=req_headers)
+                resp = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    BrokenPipeError, ConnectionResetError):
+                _drop_connection(parsed.scheme, parsed.netloc)
+                if attempt:
+                    raise
+
+        if resp.status in (301, 302, 303, 307, 308):
+            location = resp.getheader("Location")
+            resp.read()
+            if not location:
+                raise RuntimeError(f"Redirect without Location from {url}")
+            url = urljoin(url, location)
+            continue
+        if resp.will_close:
+            # Let the next request open a fresh connection instead of reusing a closed one.
+            _drop_connection(parsed.scheme, parsed.netloc)
+        return resp, url
+    raise RuntimeError(f"Too many redirects for {url}")
+
+
+def download(url: str, dest: str, headers: Optional[Dict[str, str]] = None) -> http.client.HTTPResponse:
+    """
+    Stream url into dest (written atomically). Returns the response, whose status may be 304
+    when conditional headers were given, in which case dest is left untouched.
+    """
+    with tracing.span("pdf.download", url=url, conditional=bool(headers)) as sp:
+        resp, final_url = _request(url, headers or {})
+        sp.set(status=resp.status)
+        if resp.status == 304:
+            resp.read()
+            return resp
+        if resp.status != 200:
+            resp.read()
+            raise RuntimeError(f"HTTP {resp.status} {resp.reason} for {final_url}")
+
+        fd, part = tempfile.mkstemp(dir=os.path.dirname(dest) or ".", suffix=".part")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    block = resp.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    f.write(block)
+                    size += len(block)
+            os.replace(part, dest)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            # The connection is in an unknown state after a partial read.
+            parsed = urlparse(final_url)
+            _drop_connection(parsed.scheme, parsed.netloc)
+            raise
+        finally:
+            sp.set(bytes=size)
+        return resp
+
+
+# ------------ Cache ------------
+def _key_lock(key: str) -> threading.Lock:
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def _cached_pdf(url: str, arxiv_id: str) -> str:
+    safe = arxiv_id.replace("/", "_")
+    pdf_path = cache_path("pdfs", f"{safe}.pdf")
+    meta_path = cache_path("pdfs", f"{safe}.json")
+
+    with _key_lock(arxiv_id):
+        versioned = split_arxiv_version(arxiv_id)[1] is not None
+        if os.path.exists(pdf_path) and versioned:
+            os.utime(pdf_path)
+            return pdf_path
+
+        headers = {}
+        if os.path.exists(pdf_path) and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        resp = download(url, pdf_path, headers)
+        if resp.status == 304:
+            os.utime(pdf_path)
+            return pdf_path
+
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "url": url,
+                "etag": resp.getheader("ETag"),
+                "last_modified": resp.getheader("Last-Modified"),
+                "fetched": time.time(),
+            }, f)
+
+    evict()
+    return pdf_path
+
+
+def evict():
+    """Remove cached PDFs unused for CACHE_MAX_AGE_DAYS, then the least recently used above CACHE_MAX_BYTES."""
+    with _evict_lock:
+        _evict()
+
+
+def _evict():
+    folder = os.path.dirname(cache_path("pdfs", "x"))
+    now = time.time()
+    entries = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        # files may vanish under the scan: a download renaming its .part, another process evicting
+        try:
+            if not name.endswith(".pdf"):
+                # stale partial downloads from a crashed run
+                if name.endswith(".part") and now - os.path.getmtime(path) > TIMEOUT * 10:
+                    os.remove(path)
+                continue
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if now - mtime <= CACHE_MAX_AGE_DAYS * 86400 and total <= CACHE_MAX_BYTES:
+            break
+        for p in (path, path[:-len(".pdf")] + ".json"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+@contextmanager
+def open_pdf(path_or_url: str) -> Iterator[str]:
+    """
+    Yield a local path for a PDF path or URL.
+    arXiv PDFs come from (and stay in) the cache; other downloads are removed on exit.
+    """
+    parsed = urlparse(path_or_url)
+    if parsed.scheme not in ("http", "https"):
+        yield path_or_url
+        return
+
+    arxiv_id = arxiv_id_from_url(path_or_url)
+    if arxiv_id:
+        yield _cached_pdf(path_or_url, arxiv_id)
+        return
+
+    fd, tmp = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        download(path_or_url, tmp)
+        yield tmp
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# ------------ Text extraction ------------
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    """One pool per process, shared by every paper (and thread) that extracts text."""
+    global _pool
+    with _pool_guard:
+        if _pool is None:
+            # forkserver/spawn: forking a process that already runs worker threads is unsafe
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _extract_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_page_texts(
+    pdf_path: str,
+    max_pages: int = EXTRACT_MAX_PAGES,
+    workers: int = EXTRACT_WORKERS,
+) -> Iterator[str]:
+    """
+    Yield the text of each page in order.
+    max_pages > 0 stops after that many pages; workers > 1 spreads page ranges over a process pool.
+    """
+    from pypdf import PdfReader  # imported on first use: a stage that never reads a PDF skips pypdf
+    reader = PdfReader(pdf_path)
+    n = len(reader.pages)
+    if max_pages > 0:
+        n = min(n, max_pages)
+
+    if workers <= 1 or n <= PAGES_PER_TASK:
+        for i in range(n):
+            yield reader.pages[i].extract_text() or ""
+        return
+
+    pool = _process_pool(workers)
+    futures = [
+        pool.submit(_extract_range, pdf_path, start, min(start + PAGES_PER_TASK, n))
+        for start in range(0, n, PAGES_PER_TASK)
+    ]
+    try:
+        for fut in futures:
+            yield from fut.result()
+    finally:
+        # the consumer stopped early (or failed): don't keep the pool busy for nothing
+        for fut in futures:
+            fut.cancel()
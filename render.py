@@ -0,0 +1,127 @@
+# render.py
+"""
+Markdown -> HTML for the email, one block at a time.
+
+A digest file only grows during the day (run_daily_digest appends), so it is split into blocks:
+the header, each keyword section heading (with its "(No results)" line) and each paper block.
+Every block is rendered once and stored under the hash of its text in <cache>/fragments.sqlite;
+later runs only render the blocks that are new.
+
+Environment variables:
+   - FRAGMENT_CACHE_MAX_AGE_DAYS: fragments unused for longer are evicted (default 7)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import markdown
+
+from utils import cache_path
+
+DB_NAME = "fragments.sqlite"
+MAX_AGE_DAYS = float(os.getenv("FRAGMENT_CACHE_MAX_AGE_DAYS", "7"))
+MD_EXTENSIONS = ["extra", "sane_lists", "nl2br", "tables", "fenced_code", "toc", "md_in_html"]
+RENDER_VERSION = "1"  # bump when the markdown setup changes, so old fragments miss
+
+# a block starts at a keyword section ("## kw") or a paper heading ("### [title](url)")
+_BLOCK_START_RE = re.compile(r"^(?:## |### \[.*\]\(\S+\)\s*$)")
+_PAPER_HEAD_RE = re.compile(r"^### \[.*\]\(\S+\)\s*$")
+
+_local = threading.local()
+_memo: Dict[str, str] = {}
+
+
+def split_blocks(md_text: str) -> List[str]:
+    """Split a digest into header / section / paper blocks; "".join(blocks) == md_text."""
+    blocks: List[str] = []
+    current: List[str] = []
+    for line in md_text.splitlines(keepends=True):
+        if _BLOCK_START_RE.match(line) and current:
+            blocks.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append("".join(current))
+    return blocks
+
+
+def _converter() -> markdown.Markdown:
+    # building a Markdown instance loads every extension: do it once per thread and reset() between uses
+    md = getattr(_local, "md", None)
+    if md is None:
+        md = _local.md = markdown.Markdown(extensions=MD_EXTENSIONS, output_format="html5")
+    return md
+
+
+def _key(block: str) -> str:
+    raw = "\x1f".join([RENDER_VERSION, ",".join(MD_EXTENSIONS), block])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(cache_path(DB_NAME), timeout=30)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fragments (
+            key TEXT PRIMARY KEY,
+            accessed REAL NOT NULL,
+            html TEXT NOT NULL
+        )
+        """
+    )
+    return conn
+
+
+def render_block(block: str) -> str:
+    md = _converter()
+    md.reset()
+    return md.convert(block)
+
+
+def render_fragments(md_text: str) -> List[Tuple[str, str]]:
+    """(markdown, html) of every block of a digest, in order; HTML comes from the fragment cache when possible."""
+    blocks = split_blocks(md_text)
+    keys = [_key(b) for b in blocks]
+    now = time.time()
+    conn = _connect()
+    try:
+        missing = [k for k in dict.fromkeys(keys) if k not in _memo]
+        for i in range(0, len(missing), 500):  # stay below SQLite's bound-parameter limit
+            part = missing[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, html FROM fragments WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            _memo.update(rows)
+
+        rendered = 0
+        for key, block in zip(keys, blocks):
+            if key not in _memo:
+                _memo[key] = render_block(block)
+                conn.execute("INSERT OR REPLACE INTO fragments (key, accessed, html) VALUES (?, ?, ?)",
+                             (key, now, _memo[key]))
+                rendered += 1
+        conn.executemany("UPDATE fragments SET accessed = ? WHERE key = ?", [(now, k) for k in set(keys)])
+        conn.execute("DELETE FROM fragments WHERE accessed < ?", (now - MAX_AGE_DAYS * 86400,))
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"[render] {len(blocks)} blocks, {rendered} rendered, {len(blocks) - rendered} from cache")
+    return [(block, _memo[key]) for key, block in zip(keys, blocks)]
+
+
+def render_markdown(md_text: str) -> str:
+    """HTML of a whole digest, built from cached per-block fragments."""
+    return "\n".join(html for _, html in render_fragments(md_text))
+
+
+def paper_heading(block: str) -> str | None:
+    """The '### [title](url)' line of a paper block, None for header/section blocks."""
+    for line in block.splitlines():
+        if line.strip():
+            return line if _PAPER_HEAD_RE.match(line) else None
+    return None
\ No newline at end of file
@@ -0,0 +1,155 @@
+# state_store.py
+"""
+Persistent run state kept in <cache>/state.sqlite.
+
+SeenIndex: every arXiv id (with version) that has been summarized into the archive.
+The index is (re)built from the YYYY/MM/DD.md files, so a lost cache only costs one scan;
+files are rescanned only when their size changes.
+
+HighWaterMarks: per arXiv query, the newest `published` timestamp already processed, so the
+next run only pages through submissions newer than that.
+"""
+
+import glob
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+from utils import arxiv_id_from_url, cache_path, split_arxiv_version
+
+DB_NAME = "state.sqlite"
+
+_PAPER_HEAD_RE = re.compile(r"^### \[.*\]\((\S+)\)\s*$")
+_SECTION_RE = re.compile(r"^##? ")
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(cache_path(DB_NAME), timeout=30, check_same_thread=False)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS seen (
+            arxiv_id TEXT PRIMARY KEY,
+            base_id TEXT NOT NULL,
+            version INTEGER,
+            day TEXT
+        );
+        CREATE TABLE IF NOT EXISTS scanned_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS high_water (
+            query TEXT PRIMARY KEY,
+            published TEXT NOT NULL
+        );
+        """
+    )
+    return conn
+
+
+def iter_summarized(md_text: str) -> Iterator[str]:
+    """Yield the URL of every paper block in a digest file whose summary did not fail."""
+    url = None
+    failed = False
+    for line in md_text.splitlines():
+        m = _PAPER_HEAD_RE.match(line)
+        if m or _SECTION_RE.match(line):
+            if url and not failed:
+                yield url
+            url, failed = (m.group(1) if m else None), False
+        elif url and "(summary failed:" in line:
+            failed = True
+    if url and not failed:
+        yield url
+
+
+class SeenIndex:
+    """arXiv ids (with version) that are already in the archive; O(1) lookups."""
+
+    def __init__(self):
+        self._conn = _connect()
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM seen WHERE arxiv_id = ?", (arxiv_id,)).fetchone()
+        return row is not None
+
+    def add(self, arxiv_id: str, day: str = ""):
+        base_id, version = split_arxiv_version(arxiv_id)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO seen (arxiv_id, base_id, version, day) VALUES (?, ?, ?, ?)",
+                (arxiv_id, base_id, version, day),
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def sync_archive(self, root: str = ".") -> Tuple[int, int]:
+        """
+        Index every YYYY/MM/DD.md under root that is new or changed since the last scan
+        (the first call is the one-time bootstrap). Returns (files scanned, ids added).
+        """
+        before = len(self)
+        scanned = 0
+        pattern = os.path.join(root, "[0-9][0-9][0-9][0-9]", "[0-9][0-9]", "[0-9][0-9].md")
+        with self._lock:
+            known = dict(self._conn.execute("SELECT path, size FROM scanned_files").fetchall())
+            for path in sorted(glob.glob(pattern)):
+                rel = os.path.relpath(path, root)
+                size = os.path.getsize(path)
+                if known.get(rel) == size:
+                    continue
+                day = rel[:-len(".md")].replace(os.sep, "-")
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                rows = []
+                for url in iter_summarized(text):
+                    arxiv_id = arxiv_id_from_url(url)
+                    if arxiv_id:
+                        base_id, version = split_arxiv_version(arxiv_id)
+                        rows.append((arxiv_id, base_id, version, day))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO seen (arxiv_id, base_id, version, day) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO scanned_files (path, size) VALUES (?, ?)", (rel, size)
+                )
+                scanned += 1
+            self._conn.commit()
+        return scanned, len(self) - before
+
+
+class HighWaterMarks:
+    """Newest processed `published` timestamp per query. Marks only ever move forward."""
+
+    def __init__(self):
+        self._conn = _connect()
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, query: str) -> Optional[datetime]:
+        with self._lock:
+            row = self._conn.execute("SELECT published FROM high_water WHERE query = ?", (query,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def advance(self, query: str, published: datetime):
+        current = self.get(query)
+        if current is not None and published <= current:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO high_water (query, published) VALUES (?, ?)",
+                (query, published.isoformat()),
+            )
+            self._conn.commit()
@@ -0,0 +1,87 @@
+# subscribers.py
+"""
+Subscribers of the digest: who gets an email, for which keywords and calendars.
+
+One run fetches and summarizes the union of every subscriber's keywords (each paper once), then
+renders and sends one email per subscriber from the day's digest store.
+
+Configuration: a JSON list, from the SUBSCRIBERS env var or the file at SUBSCRIBERS_PATH:
+   [
+     {"name": "alice", "email": "alice@example.com",
+      "keywords": {"3D reconstruction": ["avatar", "video understanding"]},
+      "calendar_ids": ["primary", "team@group.calendar.google.com"]},
+     {"name": "bob", "email": "bob@example.com", "keywords": ["model collapse"], "calendar_ids": []}
+   ]
+"email" is required. "keywords" is {topic: [keyword, ...]} like main.KEYWORDS, or a plain list.
+Without "calendar_ids" the CALENDAR_IDS / CALENDAR_ID setting is used; [] means no calendar in that email.
+Without any configuration there is a single subscriber: main.KEYWORDS, EMAIL_TO, CALENDAR_IDS
+(the only one whose email may fall back to EMAIL_TO).
+
+Environment variables:
+   - SUBSCRIBERS: the JSON list itself (e.g. from a repository secret); takes precedence
+   - SUBSCRIBERS_PATH: JSON file with the list (default "subscribers.json")
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+SUBSCRIBERS_PATH = os.getenv("SUBSCRIBERS_PATH", "subscribers.json")
+
+
+@dataclass
+class Subscriber:
+    name: str
+    email: Optional[str]
+    keywords_by_topic: Dict[str, List[str]]
+    calendar_ids: Optional[List[str]] = None  # None = the configured default calendars
+
+    @property
+    def keywords(self) -> List[str]:
+        return list(dict.fromkeys(kw for kws in self.keywords_by_topic.values() for kw in kws))
+
+
+def _parse(entry: Dict, index: int) -> Subscriber:
+    # no fallback to EMAIL_TO here: it would send this subscriber's digest to the default recipient
+    if not entry.get("email"):
+        name = f" ({entry['name']!r})" if entry.get("name") else ""
+        raise ValueError(f"subscriber entry {index}{name} has no \"email\"")
+    keywords = entry.get("keywords") or {}
+    if isinstance(keywords, list):
+        keywords = {"": keywords}
+    calendar_ids = entry.get("calendar_ids")
+    if isinstance(calendar_ids, str):
+        calendar_ids = [c.strip() for c in calendar_ids.split(",") if c.strip()]
+    return Subscriber(
+        name=entry.get("name") or entry["email"],
+        email=entry["email"],
+        keywords_by_topic={topic: list(kws) for topic, kws in keywords.items()},
+        calendar_ids=calendar_ids,
+    )
+
+
+def load_subscribers(default_keywords: Dict[str, List[str]], path: str = SUBSCRIBERS_PATH) -> List[Subscriber]:
+    raw = os.getenv("SUBSCRIBERS")
+    if not raw and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = f.read()
+    if not raw:
+        return [Subscriber(name="default", email=os.getenv("EMAIL_TO"), keywords_by_topic=default_keywords)]
+    entries = json.loads(raw)
+    if isinstance(entries, dict):
+        entries = [entries]
+    return [_parse(e, i) for i, e in enumerate(entries)]
+
+
+def union_keywords(subscribers: List[Subscriber]) -> Dict[str, List[str]]:
+    """All subscribers' keywords as one {topic: [keyword, ...]}; each keyword appears once (first topic wins)."""
+    union: Dict[str, List[str]] = {}
+    seen = set()
+    for sub in subscribers:
+        for topic, kws in sub.keywords_by_topic.items():
+            for kw in kws:
+                if kw not in seen:
+                    seen.add(kw)
+                    union.setdefault(topic, []).append(kw)
+    return union
\ No newline at end of file
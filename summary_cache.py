@@ -0,0 +1,108 @@
+# summary_cache.py
+"""
+Content-addressed on-disk cache for merged paper summaries (SQLite).
+
+The key combines the versioned arXiv id, the model name and a fingerprint of
+the prompt/schema, so changing any of them simply misses the cache.
+
+Environment variables:
+   - SUMMARY_CACHE_DISABLE: set to 1 to bypass the cache
+   - SUMMARY_CACHE_MAX_AGE_DAYS: entries older than this are evicted (default 30)
+   - SUMMARY_CACHE_MAX_MB: least recently used entries are evicted above this size (default 64)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils import cache_path
+
+DB_NAME = "summaries.sqlite"
+MAX_AGE_DAYS = float(os.getenv("SUMMARY_CACHE_MAX_AGE_DAYS", "30"))
+MAX_BYTES = int(float(os.getenv("SUMMARY_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.getenv("SUMMARY_CACHE_DISABLE", "") not in ("1", "true", "yes")
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(cache_path(DB_NAME), timeout=30)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY,
+            arxiv_id TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL,
+            value TEXT NOT NULL
+        )
+        """
+    )
+    return conn
+
+
+def make_key(arxiv_id: str, model: str, prompt_fingerprint: str) -> str:
+    raw = "\x1f".join([arxiv_id, model, prompt_fingerprint])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    if not enabled():
+        return None
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT value, created FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > MAX_AGE_DAYS * 86400:
+                conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE summaries SET accessed = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            return json.loads(row[0])
+        finally:
+            conn.close()
+
+
+def put(key: str, arxiv_id: str, summary: Dict[str, Any]):
+    if not enabled():
+        return
+    value = json.dumps(summary, ensure_ascii=False)
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, arxiv_id, created, accessed, size, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, arxiv_id, now, now, len(value.encode("utf-8")), value),
+            )
+            _evict(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def _evict(conn: sqlite3.Connection, now: float):
+    """Drop expired entries, then least recently used ones until under MAX_BYTES."""
+    conn.execute("DELETE FROM summaries WHERE created < ?", (now - MAX_AGE_DAYS * 86400,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    for key, size in conn.execute("SELECT key, size FROM summaries ORDER BY accessed ASC").fetchall():
+        if total <= MAX_BYTES:
+            break
+        conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+        total -= size
@@ -0,0 +1,184 @@
+# tracing.py
+"""
+Lightweight per-run tracing.
+
+Code wraps each stage in `with span("pdf.download", url=...) as s:` and attaches numbers with
+s.set(bytes=...) / s.add("retries"). Every finished span is appended as one JSON line to the
+run log <cache>/runs/<YYYYmmdd-HHMMSS>-<pid>.jsonl; end_run() appends a summary record and
+returns a table of where time, bytes and tokens went.
+
+Span names are "<area>.<stage>": arxiv.query, pdf.download, pdf.extract, llm.chat,
+paper.summarize, markdown.render, calendar.fetch, email.send, ...
+
+Environment variables:
+   - TRACE_DISABLE: set to 1 to keep spans in memory only (no run log)
+   - TRACE_KEEP_RUNS: number of run logs kept in <cache>/runs (default 30)
+"""
+
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils import cache_path
+
+KEEP_RUNS = int(os.getenv("TRACE_KEEP_RUNS", "30"))
+# numeric attributes summed per span name in the summary table
+SUMMED = ("bytes", "prompt_tokens", "cached_tokens", "completion_tokens", "retries")
+
+_local = threading.local()
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_log = None  # open run log file, if any
+_run_id: Optional[str] = None
+log_path: Optional[str] = None  # run log of the current / last run
+_intervals: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+_totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+
+def enabled() -> bool:
+    return os.getenv("TRACE_DISABLE", "") not in ("1", "true", "yes")
+
+
+class Span:
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.id = next(_ids)
+        stack = getattr(_local, "stack", [])
+        self.parent = stack[-1].id if stack else None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key: str, n: float = 1):
+        self.attrs[key] = self.attrs.get(key, 0) + n
+
+
+def _write(record: Dict[str, Any]):
+    if _log is None:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _lock:
+        _log.write(line + "\n")
+        _log.flush()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """Time a block; exceptions are recorded (status "error") and re-raised."""
+    s = Span(name, attrs)
+    stack = _local.__dict__.setdefault("stack", [])
+    stack.append(s)
+    wall = time.time()
+    t0 = time.perf_counter()
+    status, error = "ok", None
+    try:
+        yield s
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        t1 = time.perf_counter()
+        stack.pop()
+        with _lock:
+            _intervals[name].append((t0, t1))
+            totals = _totals[name]
+            totals["calls"] += 1
+            totals["errors"] += status == "error"
+            totals["busy_s"] += t1 - t0
+            for key in SUMMED:
+                if isinstance(s.attrs.get(key), (int, float)):
+                    totals[key] += s.attrs[key]
+        _write({
+            "type": "span",
+            "run": _run_id,
+            "id": s.id,
+            "parent": s.parent,
+            "name": name,
+            "start": datetime.fromtimestamp(wall).isoformat(timespec="milliseconds"),
+            "duration_ms": round((t1 - t0) * 1000, 2),
+            "thread": threading.current_thread().name,
+            "status": status,
+            **({"error": error} if error else {}),
+            "attrs": s.attrs,
+        })
+
+
+def _prune_logs(folder: str):
+    logs = sorted(glob.glob(os.path.join(folder, "*.jsonl")))
+    for path in logs[:max(0, len(logs) - KEEP_RUNS + 1)]:  # +1: the log about to be opened
+        os.remove(path)
+
+
+def start_run(**attrs) -> str:
+    """Reset the in-memory totals and open a new run log. Returns the run id."""
+    global _log, _run_id, log_path
+    end_run(report=False)
+    with _lock:
+        _intervals.clear()
+        _totals.clear()
+    _run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    if enabled():
+        log_path = cache_path("runs", f"{_run_id}.jsonl")
+        _prune_logs(os.path.dirname(log_path))
+        _log = open(log_path, "a", encoding="utf-8")
+        _write({"type": "run", "run": _run_id, "start": datetime.now().isoformat(timespec="seconds"), "attrs": attrs})
+    return _run_id
+
+
+def _wall(intervals: List[Tuple[float, float]]) -> float:
+    """Length of the union of the intervals (concurrent spans are not double counted)."""
+    total, end = 0.0, float("-inf")
+    for s, e in sorted(intervals):
+        if e > end:
+            total += e - max(s, end)
+            end = e
+    return total
+
+
+def summary() -> Dict[str, Dict[str, float]]:
+    """Per span name: calls, errors, wall_s, busy_s and the summed SUMMED attributes."""
+    with _lock:
+        out = {}
+        for name, totals in _totals.items():
+            row = dict(totals)
+            row["wall_s"] = _wall(_intervals[name])
+            out[name] = row
+        return out
+
+
+def format_summary(rows: Dict[str, Dict[str, float]]) -> str:
+    cols = [("calls", "calls"), ("errors", "err"), ("wall_s", "wall s"), ("busy_s", "busy s"),
+            ("bytes", "bytes"), ("prompt_tokens", "prompt tok"), ("cached_tokens", "cached"),
+            ("completion_tokens", "compl tok"), ("retries", "retries")]
+    width = max([len("span")] + [len(n) for n in rows])
+    lines = [f"{'span':<{width}}" + "".join(f"{label:>12}" for _, label in cols)]
+    for name in sorted(rows, key=lambda n: -rows[n]["wall_s"]):
+        row = rows[name]
+        cells = []
+        for key, _ in cols:
+            v = row.get(key, 0)
+            cells.append(f"{v:>12.2f}" if key.endswith("_s") else f"{int(v):>12}")
+        lines.append(f"{name:<{width}}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def end_run(report: bool = True) -> str:
+    """Append the summary to the run log, close it and return the summary table."""
+    global _log
+    if _log is None and not report:
+        return ""
+    rows = summary()
+    _write({"type": "summary", "run": _run_id, "end": datetime.now().isoformat(timespec="seconds"), "spans": rows})
+    if _log is not None:
+        with _lock:
+            _log.close()
+            _log = None
+    return format_summary(rows) if report else ""
\ No newline at end of file
@@ -0,0 +1,82 @@
+# utils.py
+"""
+Small helpers shared by the bots.
+
+Environment variables:
+   - WORKFLOW_CACHE_DIR: where local caches/state are kept (default ./.cache)
+"""
+
+import os
+import re
+
+CACHE_DIR = os.getenv("WORKFLOW_CACHE_DIR", ".cache")
+
+# new-style ids (2604.09324v1) and old-style ids (cs/0112017v1, math.GT/0309136)
+_ARXIV_ID_RE = re.compile(
+    r"arxiv\.org/(?:abs|pdf)/((?:[a-z\-]+(?:\.[A-Za-z]{2})?/\d{7})|(?:\d{4}\.\d{4,5}))(v\d+)?",
+    re.IGNORECASE,
+)
+
+
+def cache_path(*parts: str) -> str:
+    """Path inside CACHE_DIR; the parent directory is created on demand."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return path
+
+
+def arxiv_id_from_url(url: str) -> str:
+    """
+    'https://arxiv.org/pdf/2604.09324v1' -> '2604.09324v1'
+    'http://arxiv.org/abs/2604.09324'    -> '2604.09324'
+    Returns "" if the URL is not an arXiv abs/pdf link.
+    """
+    m = _ARXIV_ID_RE.search(url or "")
+    if not m:
+        return ""
+    return m.group(1) + (m.group(2) or "")
+
+
+def split_arxiv_version(arxiv_id: str) -> tuple[str, int | None]:
+    """'2604.09324v2' -> ('2604.09324', 2); '2604.09324' -> ('2604.09324', None)"""
+    m = re.match(r"^(.*?)v(\d+)$", arxiv_id or "")
+    if not m:
+        return arxiv_id, None
+    return m.group(1), int(m.group(2))
+
+
+# ------------ Google API discovery ------------
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+DISCOVERY_MAX_AGE_DAYS = 30
+
+
+def discovery_document(api: str, version: str) -> str:
+    """
+    Discovery document of a Google API, kept in <cache>/discovery/ so building a service never
+    needs a network round trip (use with googleapiclient.discovery.build_from_document).
+    """
+    import time
+    path = cache_path("discovery", f"{api}.{version}.json")
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < DISCOVERY_MAX_AGE_DAYS * 86400:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    doc = None
+    try:
+        # google-api-python-client >= 2.0 ships the documents of the common APIs
+        from googleapiclient.discovery_cache import get_static_doc
+        doc = get_static_doc(api, version)
+    except ImportError:
+        pass
+    if not doc:
+        import urllib.request
+        with urllib.request.urlopen(DISCOVERY_URL.format(api=api, version=version), timeout=30) as resp:
+            doc = resp.read().decode("utf-8")
+
+    # own temp file per writer: concurrent callers on a cold cache must not replace each other's
+    import tempfile
+    fd, part = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(doc)
+    os.replace(part, path)
+    return doc
\ No newline at end of file